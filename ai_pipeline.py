@@ -0,0 +1,295 @@
+import os, re, json, time, asyncio, logging, itertools
+from collections import OrderedDict, deque
+
+from state_store import atomic_write
+
+log = logging.getLogger("CatTrix.ai")
+
+# Lower runs first
+PRIORITY_COMMAND = 0
+PRIORITY_CHAT = 1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0
+    return round(values[min(int(len(values) * p), len(values) - 1)], 3)
+
+
+# ======================
+# RATE LIMITING
+# ======================
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate      # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def ready(self):
+        self._refill()
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def wait(self):
+        """Seconds until the next token."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """Token buckets per (kind, key), e.g. ("guild", 123). Oldest idle buckets are evicted."""
+
+    def __init__(self, limits, max_keys=10000):
+        self.limits = limits  # kind -> (rate per second, burst)
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    def _bucket(self, kind, key):
+        k = (kind, key)
+        b = self.buckets.get(k)
+        if b is None:
+            b = self.buckets[k] = TokenBucket(*self.limits[kind])
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(k)
+        return b
+
+    def allow(self, scope):
+        """scope is {kind: key}; a request passes only if every bucket has a token."""
+        buckets = [
+            self._bucket(kind, key)
+            for kind, key in scope.items()
+            if key is not None and kind in self.limits
+        ]
+        if not all(b.ready() for b in buckets):
+            return False
+        for b in buckets:
+            b.take()
+        return True
+
+    def retry_after(self, scope):
+        """Seconds until allow(scope) can pass again."""
+        return max((
+            self._bucket(kind, key).wait()
+            for kind, key in scope.items()
+            if key is not None and kind in self.limits
+        ), default=0.0)
+
+
+# ======================
+# REQUEST PIPELINE
+# ======================
+class AIRefused(Exception):
+    """
+    A request the pipeline did not answer. reason is "rate_limited",
+    "rejected" (queue full), "expired" (waited too long) or "failed";
+    retry_after is set for rate_limited.
+    """
+
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AIPipeline:
+    """
+    Bounded-concurrency queue in front of the completion call.
+
+    Requests are rate limited per scope, then run by `concurrency` workers
+    in priority order. Chat requests are refused once `max_queue` are
+    waiting and dropped if they sat longer than `max_wait` seconds.
+    Requests that get no answer raise AIRefused.
+    """
+
+    def __init__(self, handler, limiter, concurrency=4, max_queue=100, max_wait=10.0):
+        self.handler = handler
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.queue = None
+        self.workers = []
+        self.seq = itertools.count()
+        self.waits = deque(maxlen=1000)
+        self.counts = {"submitted": 0, "completed": 0, "rate_limited": 0,
+                       "rejected": 0, "expired": 0, "failed": 0}
+
+    def _start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def submit(self, *args, scope=None, priority=PRIORITY_CHAT):
+        if self.queue is None:
+            self._start()
+
+        self.admit(scope)
+        if priority > PRIORITY_COMMAND and self.queue.qsize() >= self.max_queue:
+            self.counts["rejected"] += 1
+            raise AIRefused("rejected")
+
+        self.counts["submitted"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((priority, next(self.seq), time.monotonic(), fut, args))
+        return await fut
+
+    def admit(self, scope):
+        """Take this scope's rate-limit tokens, or raise AIRefused("rate_limited")."""
+        if scope and not self.limiter.allow(scope):
+            self.counts["rate_limited"] += 1
+            raise AIRefused("rate_limited", self.limiter.retry_after(scope))
+
+    async def _worker(self):
+        while True:
+            priority, _, queued, fut, args = await self.queue.get()
+            wait = time.monotonic() - queued
+            self.waits.append(wait)
+
+            if fut.done():
+                continue
+            if priority > PRIORITY_COMMAND and wait > self.max_wait:
+                self.counts["expired"] += 1
+                fut.set_exception(AIRefused("expired"))
+                continue
+
+            try:
+                result = await self.handler(*args)
+                self.counts["completed"] += 1
+            except Exception as e:
+                log.error(f"AI request failed: {e}")
+                self.counts["failed"] += 1
+                if not fut.done():
+                    fut.set_exception(AIRefused("failed"))
+                continue
+            if not fut.done():
+                fut.set_result(result)
+
+    def metrics(self):
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "wait_p50": percentile(self.waits, 0.5),
+            "wait_p99": percentile(self.waits, 0.99),
+            **self.counts
+        }
+
+    def close(self):
+        for w in self.workers:
+            w.cancel()
+        self.workers = []
+
+
+# ======================
+# RESPONSE CACHE
+# ======================
+_PUNCT = re.compile(r"[^\w\s]+")
+_SPACE = re.compile(r"\s+")
+
+def normalize_prompt(text):
+    """'  Hi!!  ' and 'hi' share a cache entry."""
+    return _SPACE.sub(" ", _PUNCT.sub(" ", text.casefold())).strip()
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of completions. Concurrent misses for the same key (and
+    lane) share one upstream call. With `path` set, live entries survive restarts.
+    """
+
+    def __init__(self, max_size=1000, ttl=600, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def key(*parts):
+        return "\x1f".join(str(p) for p in parts[:-1]) + "\x1f" + normalize_prompt(parts[-1])
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, value):
+        self.entries[key] = (time.time() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get_or_fetch(self, key, fetch, lane=None, refetch_on=(), on_join=None):
+        """
+        Cached value, else fetch() it. Concurrent misses for the same key and
+        `lane` share one fetch; on_join() runs (and may raise) before a caller
+        joins someone else's. One that got a `refetch_on` exception from a
+        shared fetch runs its own fetch instead.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        slot = (key, lane)
+        pending = self.inflight.get(slot)
+        if pending:
+            if on_join:
+                on_join()
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except refetch_on:
+                pass  # the other caller's outcome, not ours
+
+        self.misses += 1
+        fut = self.inflight[slot] = asyncio.ensure_future(fetch())
+        try:
+            value = await asyncio.shield(fut)
+        finally:
+            if self.inflight.get(slot) is fut:
+                del self.inflight[slot]
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def metrics(self):
+        return {"size": len(self.entries), "hits": self.hits,
+                "misses": self.misses, "coalesced": self.coalesced}
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"AI cache not loaded: {e}")
+            return
+        now = time.time()
+        for key, expires, value in data[-self.max_size:]:
+            if expires > now:
+                self.entries[key] = (expires, value)
+
+    def save(self):
+        if not self.path:
+            return
+        now = time.time()
+        data = [[k, exp, v] for k, (exp, v) in self.entries.items() if exp > now]
+        atomic_write(self.path, json.dumps(data))
@@ -0,0 +1,82 @@
+import io, os, time, logging
+from collections import OrderedDict
+
+import discord
+
+log = logging.getLogger("CatTrix.assets")
+
+
+# ======================
+# ASSET CACHE
+# ======================
+class AssetCache:
+    """
+    Welcome/leave/level-up images held in memory. Each send gets a fresh
+    BytesIO-backed discord.File, so a join wave reads the GIF from disk once.
+
+    Entries are keyed by file name (a new name from the dashboard is simply a
+    new entry), re-read when the file's mtime changes, and evicted least
+    recently used once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, folder, max_bytes=32 * 1024 * 1024, recheck=5.0):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.recheck = recheck
+        self.entries = OrderedDict()  # name -> [mtime_ns, checked_at, data]
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self):
+        while self.size > self.max_bytes and self.entries:
+            _, (_, _, data) = self.entries.popitem(last=False)
+            self.size -= len(data)
+
+    def _drop(self, name):
+        entry = self.entries.pop(name, None)
+        if entry:
+            self.size -= len(entry[2])
+
+    def get(self, name):
+        """Return the bytes of assets/<name>, or None if it doesn't exist."""
+        if not name:
+            return None
+        path = os.path.join(self.folder, os.path.basename(name))
+        now = time.monotonic()
+
+        entry = self.entries.get(name)
+        if entry and now - entry[1] < self.recheck:
+            self.entries.move_to_end(name)
+            self.hits += 1
+            return entry[2]
+
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._drop(name)
+            return None
+
+        if entry and entry[0] == mtime:
+            entry[1] = now
+            self.entries.move_to_end(name)
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        with open(path, "rb") as f:
+            data = f.read()
+
+        self._drop(name)
+        if len(data) <= self.max_bytes:
+            self.entries[name] = [mtime, now, data]
+            self.size += len(data)
+            self._evict()
+        return data
+
+    def file(self, name):
+        data = self.get(name)
+        if data is None:
+            log.warning(f"Asset missing: {name}")
+            return None
+        return discord.File(io.BytesIO(data), filename=os.path.basename(name))
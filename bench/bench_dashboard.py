@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Dashboard API latency: Flask (web/app.py, separate server reading
+state.json) vs AsyncDashboard (aiohttp in the bot's loop, live StateStore).
+
+    python bench/bench_dashboard.py [--requests 500] [--users 2000]
+"""
+import os, sys, json, time, shutil, asyncio, logging, argparse, tempfile, threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "web"))
+import httpx
+from werkzeug.serving import make_server
+from state_store import StateStore
+from web_async import AsyncDashboard
+
+
+def pct(samples, p):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * p), len(samples) - 1)] * 1000
+
+
+async def hammer(base, path, n, method="GET"):
+    samples = []
+    async with httpx.AsyncClient(base_url=base) as client:
+        for i in range(n):
+            t = time.perf_counter()
+            if method == "GET":
+                r = await client.get(path)
+            else:
+                r = await client.post(path, json={"level": {"xp_per_message": 10 + i % 5}})
+            r.raise_for_status()
+            samples.append(time.perf_counter() - t)
+    return samples
+
+
+async def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--requests", type=int, default=500)
+    p.add_argument("--users", type=int, default=2000, help="size of the stats section")
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)
+    with open(os.path.join(ROOT, "state.json")) as f:
+        state = json.load(f)
+    state["stats"]["messages"] = {str(i): i * 10 for i in range(args.users)}
+    with open("state.json", "w") as f:
+        json.dump(state, f)
+
+    import app as flask_app
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, flask_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    store = StateStore("state.json")
+    dash = AsyncDashboard(store, "127.0.0.1", 0)
+    await dash.start()
+    port = dash.runner.addresses[0][1]
+
+    targets = {
+        "flask": f"http://127.0.0.1:{server.server_port}",
+        "aiohttp": f"http://127.0.0.1:{port}",
+    }
+    cases = [("/api/state", "GET"), ("/api/state/welcome", "GET"), ("/api/update", "POST")]
+
+    for path, method in cases:
+        for name, base in targets.items():
+            samples = await hammer(base, path, args.requests, method)
+            print(f"{method:4} {path:20} {name:>7}: p50 {pct(samples, 0.5):.2f} ms, "
+                  f"p99 {pct(samples, 0.99):.2f} ms")
+
+    await dash.close()
+    server.shutdown()
+    shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
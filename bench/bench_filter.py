@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Word filter at scale: filters.compile_filter (one trie-shaped regex) vs a
+plain alternation regex vs looping over one regex per term.
+
+    python bench/bench_filter.py [--terms 10000 50000] [--messages 2000]
+"""
+import os, re, sys, time, random, string, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filters import compile_filter
+
+
+def word(rnd):
+    return "".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(3, 10)))
+
+
+def per_message(matcher, messages):
+    t = time.perf_counter()
+    hits = sum(1 for m in messages if matcher(m))
+    return (time.perf_counter() - t) / len(messages) * 1e6, hits
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--terms", type=int, nargs="+", default=[10000, 50000])
+    p.add_argument("--messages", type=int, default=2000)
+    p.add_argument("--loop-messages", type=int, default=50, help="the per-term loop is slow")
+    args = p.parse_args()
+
+    rnd = random.Random(1)
+    for n in args.terms:
+        terms = list({word(rnd) for _ in range(n)})
+        messages = [
+            " ".join(rnd.choice(terms) if rnd.random() < 0.002 else word(rnd) for _ in range(20))
+            for _ in range(args.messages)
+        ]
+
+        t = time.perf_counter()
+        trie, = compile_filter(terms)
+        trie_build = (time.perf_counter() - t) * 1000
+
+        t = time.perf_counter()
+        alt = re.compile(
+            r"(?<!\w)(?:" + "|".join(map(re.escape, sorted(terms, key=len, reverse=True))) + r")(?!\w)",
+            re.IGNORECASE
+        )
+        alt_build = (time.perf_counter() - t) * 1000
+
+        loop = [re.compile(rf"(?<!\w){re.escape(t)}(?!\w)", re.IGNORECASE) for t in terms]
+
+        print(f"{len(terms)} terms, {len(messages)} messages of 20 words")
+        us, hits = per_message(trie.search, messages)
+        print(f"  trie regex:   build {trie_build:7.0f} ms, {us:8.1f} us/msg, {hits} hits")
+        us, hits = per_message(alt.search, messages)
+        print(f"  alternation:  build {alt_build:7.0f} ms, {us:8.1f} us/msg, {hits} hits")
+        us, _ = per_message(lambda m: any(r.search(m) for r in loop), messages[:args.loop_messages])
+        print(f"  regex loop:                  {us:8.1f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Leaderboard queries at scale: ranking.RankIndex vs sorting every user per query.
+
+    python bench/bench_leaderboard.py [--users 300000] [--queries 2000]
+"""
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ranking import RankIndex
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--users", type=int, default=300000)
+    p.add_argument("--queries", type=int, default=2000)
+    args = p.parse_args()
+
+    rnd = random.Random(1)
+    xp = {uid: rnd.randrange(0, 500000, 10) for uid in range(args.users)}
+    users = list(xp)
+
+    t = time.perf_counter()
+    index = RankIndex(xp.items())
+    print(f"build {args.users} users: {(time.perf_counter() - t) * 1000:.0f} ms")
+
+    def update():
+        uid = rnd.choice(users)
+        xp[uid] += 10
+        index.set(uid, xp[uid])
+
+    def rank():
+        index.rank(rnd.choice(users))
+
+    def top():
+        index.top(10)
+
+    def naive_rank():
+        uid = rnd.choice(users)
+        order = sorted(xp, key=xp.get, reverse=True)
+        order.index(uid)
+
+    for name, fn, n in (("update", update, args.queries), ("rank", rank, args.queries),
+                        ("top10", top, args.queries), ("naive sort+rank", naive_rank, 5)):
+        p50, p99 = timed(fn, n)
+        print(f"{name:>16}: p50 {p50:9.1f} us  p99 {p99:9.1f} us")
+
+    # Sanity: index agrees with a full sort
+    order = sorted(xp.items(), key=lambda kv: -kv[1])
+    assert [x for _, x in index.top(10)] == [x for _, x in order[:10]]
+    uid = users[0]
+    assert index.rank(uid) == 1 + sum(1 for v in xp.values() if v > xp[uid])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Gateway throughput per shard: replays synthetic GUILD_CREATE/MESSAGE_CREATE
+payloads through discord.py's real parser and dispatch, with an on_message
+that grants XP into one SQLite file shared by every worker process.
+
+    python bench/bench_shards.py [--shards 4] [--workers 1 2 4] [--events 40000]
+"""
+import os, sys, time, asyncio, argparse, tempfile
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import discord
+from discord.ext import commands
+from sharding import parse_shard_ids, shard_ranges, shard_for
+from storage import SqliteStorage
+
+
+def guild_payload(gid):
+    return {
+        "id": str(gid), "name": f"guild {gid}", "unavailable": False,
+        "member_count": 1, "roles": [], "members": [], "emojis": [],
+        "stickers": [], "features": [], "threads": [],
+        "channels": [{"id": str(gid + 1), "type": 0, "name": "general",
+                      "position": 0, "permission_overwrites": []}],
+    }
+
+
+def message_payload(i, gid, uid):
+    return {
+        "id": str(i), "channel_id": str(gid + 1), "guild_id": str(gid),
+        "author": {"id": str(uid), "username": f"user{uid}", "discriminator": "0", "avatar": None},
+        "content": "hello there", "timestamp": "2024-01-01T00:00:00+00:00",
+        "edited_timestamp": None, "tts": False, "mention_everyone": False,
+        "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+        "pinned": False, "type": 0,
+    }
+
+
+async def replay(shards, ids, guilds, events, users, db_path, flush_every):
+    bot = commands.AutoShardedBot(
+        command_prefix="!", intents=discord.Intents.default(),
+        shard_count=shards, shard_ids=ids, chunk_guilds_at_startup=False
+    )
+    await bot._async_setup_hook()
+    state = bot._connection
+    storage = SqliteStorage(db_path)
+
+    owned = [g for g in guilds if shard_for(g, shards) in ids]
+    for gid in owned:
+        state.parsers["GUILD_CREATE"](guild_payload(gid))
+
+    pending = {}
+    handled = 0
+
+    def flush():
+        batch = pending.copy()
+        pending.clear()
+        with storage.transaction():
+            for (gid, uid), count in batch.items():
+                storage.add_xp(gid, uid, count * 10)
+
+    @bot.event
+    async def on_message(msg):
+        nonlocal handled
+        key = (msg.guild.id, msg.author.id)
+        pending[key] = pending.get(key, 0) + 1
+        handled += 1
+        if handled % flush_every == 0:
+            flush()
+
+    n = events * len(owned) // len(guilds)
+    start = time.perf_counter()
+    for i in range(n):
+        gid = owned[i % len(owned)]
+        state.parsers["MESSAGE_CREATE"](message_payload(i, gid, i % users))
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    while handled < n:
+        await asyncio.sleep(0)
+    flush()
+    elapsed = time.perf_counter() - start
+
+    storage.close()
+    await bot.close()
+    return len(ids), n, elapsed
+
+
+def worker(args):
+    return asyncio.run(replay(*args))
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--shards", type=int, default=4)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--events", type=int, default=40000)
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--flush-every", type=int, default=500)
+    args = p.parse_args()
+
+    # Snowflakes spread over every shard
+    guilds = [(n << 22) + n for n in range(args.shards * 25)]
+
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, "bench.db")
+            SqliteStorage(db).close()
+            jobs = [
+                (args.shards, parse_shard_ids(r), guilds, args.events, args.users, db, args.flush_every)
+                for r in shard_ranges(args.shards, workers)
+            ]
+            start = time.perf_counter()
+            with Pool(len(jobs)) as pool:
+                results = pool.map(worker, jobs)
+            wall = time.perf_counter() - start
+
+        total = sum(n for _, n, _ in results)
+        per_shard = [n / elapsed / count for count, n, elapsed in results]
+        print(f"{workers} worker(s) x {args.shards // workers or 1} shard(s): "
+              f"{total / max(e for _, _, e in results):,.0f} events/s total, "
+              f"{sum(per_shard) / len(per_shard):,.0f} events/s per shard "
+              f"(wall {wall:.2f}s incl. startup)")
+
+
+if __name__ == "__main__":
+    main()
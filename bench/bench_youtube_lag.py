@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Event-loop lag while polling a (mocked) YouTube Data API.
+
+"sync" issues blocking requests from inside a coroutine, the way the old
+googleapiclient .execute() calls did; "async" uses youtube_api.AsyncYouTube.
+
+    python bench/bench_youtube_lag.py [--calls 50] [--delay 0.05]
+"""
+import os, sys, time, asyncio, argparse
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from youtube_api import AsyncYouTube
+from mock_api import start_mock
+
+ROUTES = {"/youtube/v3/search": {"items": [{"id": {"videoId": "abc"}, "snippet": {"title": "t"}}]}}
+
+
+async def measure_lag(work, tick=0.01):
+    """Run work() while a ticker records how late each 10 ms wakeup is."""
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+        while not done.is_set():
+            t = loop.time()
+            await asyncio.sleep(tick)
+            lags.append(loop.time() - t - tick)
+
+    t = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await t
+    lags.sort()
+    return elapsed, lags[len(lags) // 2], lags[int(len(lags) * 0.99)], lags[-1]
+
+
+async def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--calls", type=int, default=50)
+    p.add_argument("--delay", type=float, default=0.05, help="mock server latency (s)")
+    args = p.parse_args()
+
+    server, base = start_mock(ROUTES, args.delay)
+    url = f"{base}/youtube/v3"
+
+    sync_client = httpx.Client(base_url=url)
+
+    async def sync_work():
+        for _ in range(args.calls):
+            sync_client.get("/search", params={"part": "snippet"}).json()
+            await asyncio.sleep(0)
+
+    yt = AsyncYouTube(api_key="bench", base_url=url)
+
+    async def async_work():
+        await asyncio.gather(*(yt.search(part="snippet") for _ in range(args.calls)))
+
+    for name, work in (("sync", sync_work), ("async", async_work)):
+        elapsed, p50, p99, worst = await measure_lag(work)
+        print(f"{name:>5}: {args.calls} calls in {elapsed:.2f}s | "
+              f"loop lag p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, max {worst * 1000:.1f} ms")
+
+    sync_client.close()
+    await yt.aclose()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
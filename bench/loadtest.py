@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Synthetic load test for the bot's event handlers, without Discord.
+
+catTrix.py is imported as a module and its handlers are called with fake
+Message/Member/Interaction objects; OpenRouter and the YouTube Data API are
+local mock servers (mock_api.py). Every run uses a scratch copy of
+state.json, so the repo's data is never touched.
+
+    python bench/loadtest.py chat --rate 5000 --users 1000 --duration 10
+    python bench/loadtest.py joinwave --members 500
+    python bench/loadtest.py commands --events 2000
+    python bench/loadtest.py youtube --channels 50
+
+Each scenario reports throughput, p50/p99 handler latency and RSS.
+"""
+import os, sys, json, time, random, shutil, asyncio, argparse, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from mock_api import start_mock
+from gateway_profile import rss_mb
+
+CHANNEL_ID = 1000
+WORDS = "meow purr stream hello clip level when next video gg lol nice cat".split()
+
+
+def pct(samples, p):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * p), len(samples) - 1)] * 1000
+
+
+# ======================
+# FAKE DISCORD OBJECTS
+# ======================
+class FakeMessage:
+    def __init__(self, channel, content="", author=None, guild=None, embed=None):
+        self.channel = channel
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.embed = embed
+
+    async def edit(self, embed=None, **kwargs):
+        await self.channel.api.call()
+
+    async def delete(self, **kwargs):
+        await self.channel.api.call()
+
+
+class FakeAPI:
+    """Counts REST calls; each costs `delay` seconds, like a Discord round trip."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+
+class FakeChannel:
+    def __init__(self, channel_id, api):
+        self.id = channel_id
+        self.api = api
+
+    async def send(self, content=None, embed=None, file=None, **kwargs):
+        await self.api.call()
+        return FakeMessage(self, content or "", embed=embed)
+
+
+class FakeGuild:
+    def __init__(self, guild_id, api):
+        self.id = guild_id
+        self.name = f"guild {guild_id}"
+        self.channel = FakeChannel(guild_id + 1, api)
+        self.owner_id = 1
+
+    def get_channel(self, channel_id):
+        return self.channel
+
+
+class FakeAsset:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+
+class FakeMember:
+    def __init__(self, user_id, guild):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+        self.guild = guild
+        self.display_avatar = FakeAsset()
+
+
+class FakeResponse:
+    def __init__(self, api):
+        self.api = api
+
+    async def send_message(self, content=None, embed=None, **kwargs):
+        await self.api.call()
+
+    async def defer(self, **kwargs):
+        await self.api.call()
+
+
+class FakeInteraction:
+    def __init__(self, user, guild):
+        self.user = user
+        self.guild = guild
+        self.channel = guild.channel
+        self.response = FakeResponse(guild.channel.api)
+        self.followup = guild.channel
+
+
+# ======================
+# HARNESS
+# ======================
+def load_bot(args, workdir):
+    """Import catTrix inside `workdir` with its external APIs pointed at mocks."""
+    ai_reply = {"choices": [{"message": {"content": "meow"}}]}
+    ai_mock, ai_url = start_mock({"/api/v1/chat/completions": ai_reply}, args.ai_delay)
+    yt_mock, yt_url = start_mock(youtube_routes(args.channels), args.yt_delay)
+
+    with open(os.path.join(ROOT, "state.json")) as f:
+        state = json.load(f)
+    for section in ("welcome", "leave", "level"):
+        state[section].update(enabled=True, channel_id=CHANNEL_ID)
+    state["servers"]["GLOBAL"]["moderation"]["log_channel_id"] = CHANNEL_ID
+    state["yt_channels"] = {f"UC{i:022d}": {"videos": True, "shorts": True, "live": True}
+                            for i in range(args.channels)}
+    with open(os.path.join(workdir, "state.json"), "w") as f:
+        json.dump(state, f)
+    shutil.copytree(os.path.join(ROOT, "assets"), os.path.join(workdir, "assets"))
+
+    os.environ.update(
+        DISCORD_TOKEN="bench",
+        OPENROUTER_API_KEY="bench",
+        OPENROUTER_MODEL="bench",
+        OPENROUTER_URL=ai_url + "/api/v1/chat/completions",
+        YOUTUBE_API_KEY="bench",
+        YOUTUBE_API_URL=yt_url + "/youtube/v3",
+        STORAGE_BACKEND=args.storage,
+        DB_PATH=os.path.join(workdir, "cattrix.db"),
+        GUILDS_DIR=os.path.join(workdir, "guilds"),
+        JOIN_WAVE_WINDOW=str(args.wave_window),
+    )
+    os.chdir(workdir)
+    import catTrix
+    return catTrix
+
+
+def youtube_routes(channels):
+    def playlist(handler):
+        pid = handler.path.split("playlistId=")[1].split("&")[0]
+        return {"items": [{"contentDetails": {"videoId": f"{pid[-8:]}{n}"}} for n in range(5)]}
+
+    def videos(handler):
+        ids = handler.path.split("id=")[1].split("&")[0].replace("%2C", ",").split(",")
+        return {"items": [{"id": v, "snippet": {"title": v, "liveBroadcastContent": "none"},
+                           "contentDetails": {"duration": "PT4M"}} for v in ids]}
+
+    return {"/youtube/v3/playlistItems": playlist, "/youtube/v3/videos": videos,
+            "/youtube/v3/channels": {"items": []}}
+
+
+async def run_events(events, rate, sequential=False):
+    """
+    Start each (handler, args) as its own task, like discord.py's dispatch
+    (or one after another, like a polling loop). rate is events/min
+    (0 = as fast as possible). Returns (latencies, elapsed).
+    """
+    latencies = []
+
+    async def timed(handler, a):
+        t = time.perf_counter()
+        await handler(*a)
+        latencies.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    tasks = []
+    interval = 60 / rate if rate else 0
+    for i, (handler, a) in enumerate(events):
+        if interval:
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif i % 100 == 0:
+            await asyncio.sleep(0)
+        if sequential:
+            await timed(handler, a)
+        else:
+            tasks.append(asyncio.create_task(timed(handler, a)))
+    await asyncio.gather(*tasks)
+    return latencies, time.perf_counter() - start
+
+
+# ======================
+# SCENARIOS
+# ======================
+def chat_events(bot, args, api):
+    guilds = [FakeGuild(10 ** 6 + 10 * g, api) for g in range(args.guilds)]
+    members = [FakeMember(10 ** 7 + u, guilds[u % len(guilds)]) for u in range(args.users)]
+    n = args.events or int(args.rate * args.duration / 60)
+    rng = random.Random(1)
+    for _ in range(n):
+        author = rng.choice(members)
+        text = " ".join(rng.choices(WORDS, k=rng.randint(2, 10)))
+        yield bot.on_message, (FakeMessage(author.guild.channel, text, author, author.guild),)
+
+
+def joinwave_events(bot, args, api):
+    guild = FakeGuild(2 * 10 ** 6, api)
+    for u in range(args.members):
+        yield bot.handle_join_leave, (guild, FakeMember(2 * 10 ** 7 + u, guild), True)
+
+
+def command_events(bot, args, api):
+    guilds = [FakeGuild(10 ** 6 + 10 * g, api) for g in range(args.guilds)]
+    members = [FakeMember(10 ** 7 + u, guilds[u % len(guilds)]) for u in range(args.users)]
+    cog = bot.Moderation(bot.bot)
+    rng = random.Random(2)
+    for i in range(args.events or 2000):
+        mod, target = rng.choice(members), rng.choice(members)
+        interaction = FakeInteraction(mod, target.guild)
+        if i % 2:
+            yield bot.profile.callback, (interaction, target)
+        else:
+            yield bot.Moderation.warn.callback, (cog, interaction, target, "load test")
+
+
+def youtube_events(bot, args, api):
+    channel = FakeChannel(CHANNEL_ID, api)
+    bot.bot.get_channel = lambda channel_id: channel
+    for _ in range(args.events or 5):
+        yield bot.monitor.check_channels, ()
+
+
+async def scenario(args):
+    workdir = tempfile.mkdtemp(prefix="cattrix-load-")
+    try:
+        bot = load_bot(args, workdir)
+        api = FakeAPI(args.discord_delay)
+
+        # What setup_hook would start, minus the gateway-only parts
+        bot.store.start()
+        # There are no prefix commands, and Context needs a real ConnectionState
+        async def process_commands(msg):
+            pass
+        bot.bot.process_commands = process_commands
+        bot.guilds.start()
+        bot.xp_batcher.start()
+        rss_before = rss_mb()
+
+        make = {"chat": chat_events, "joinwave": joinwave_events,
+                "commands": command_events, "youtube": youtube_events}
+        events = list(make[args.scenario](bot, args, api))
+        rate = args.rate if args.scenario == "chat" else 0
+
+        latencies, elapsed = await run_events(events, rate, sequential=args.scenario == "youtube")
+        # Let join-wave batches and the XP batcher finish before counting sends
+        await asyncio.sleep(args.wave_window + 0.1 if args.scenario == "joinwave" else 0)
+        await bot.xp_batcher.flush()
+
+        print(f"{args.scenario}: {len(latencies)} events in {elapsed:.2f}s "
+              f"= {len(latencies) / elapsed:.0f}/s ({args.storage} storage)")
+        print(f"  latency p50 {pct(latencies, 0.5):.2f} ms  p99 {pct(latencies, 0.99):.2f} ms  "
+              f"max {max(latencies) * 1000:.2f} ms")
+        print(f"  discord API calls {api.calls}  AI {bot.ai.pipeline.counts}")
+        print(f"  RSS {rss_before:.1f} -> {rss_mb():.1f} MiB")
+        bot.shutdown()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Drive CatTrix handlers with synthetic traffic")
+    p.add_argument("scenario", choices=["chat", "joinwave", "commands", "youtube"])
+    p.add_argument("--rate", type=int, default=5000, help="chat messages per minute (0 = flat out)")
+    p.add_argument("--duration", type=float, default=10, help="chat seconds to replay")
+    p.add_argument("--events", type=int, default=0, help="event count (overrides --rate * --duration)")
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--guilds", type=int, default=10)
+    p.add_argument("--members", type=int, default=500, help="joinwave size")
+    p.add_argument("--wave-window", type=float, default=1.0, help="JOIN_WAVE_WINDOW for the run")
+    p.add_argument("--channels", type=int, default=20, help="YouTube channels to poll")
+    p.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    p.add_argument("--ai-delay", type=float, default=0.3, help="mock OpenRouter latency (s)")
+    p.add_argument("--yt-delay", type=float, default=0.05, help="mock YouTube latency (s)")
+    p.add_argument("--discord-delay", type=float, default=0.05, help="fake Discord REST latency (s)")
+    args = p.parse_args()
+    asyncio.run(scenario(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Concurrent writers on one state.json: a bot process (StateStore flushing
+its own section) and several dashboard processes doing compare-and-swap
+increments through /api/update. Every increment must survive.
+
+    python bench/stress_state.py [--dashboards 4] [--updates 200] [--ticks 2000]
+    python bench/stress_state.py --legacy   # old unlocked read-modify-write, for comparison
+"""
+import os, sys, json, time, asyncio, argparse, tempfile
+from multiprocessing import Process, Queue
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "web"))
+from state_store import StateStore
+
+
+def bot(path, ticks, flush_every):
+    async def run():
+        store = StateStore(path)
+        for i in range(ticks):
+            store.data["bot"]["ticks"] = store.data["bot"].get("ticks", 0) + 1
+            store.mark_dirty("bot")
+            if i % flush_every == 0:
+                try:
+                    store.sync_external()
+                    await store.aflush()
+                except ValueError:
+                    pass  # torn file from a --legacy writer; retried next flush
+        store.close()
+    asyncio.run(run())
+
+
+def dashboard(path, worker, updates, legacy, out):
+    os.chdir(os.path.dirname(path))
+    import app as web
+    client = web.app.test_client()
+    conflicts = 0
+
+    for _ in range(updates):
+        if legacy:
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+            except ValueError:
+                conflicts += 1  # read a half-written file
+                continue
+            state["dash"][worker] = state["dash"].get(worker, 0) + 1
+            with open(path, "w") as f:
+                json.dump(state, f)
+            continue
+
+        while True:
+            # Read, then write back only if nobody wrote in between
+            state = client.get("/api/state").get_json()
+            count = state["dash"].get(worker, 0) + 1
+            version = state.get("_versions", {}).get("dash", 0)
+            r = client.post("/api/update", json={"dash": {worker: count}, "_versions": {"dash": version}})
+            if r.status_code != 409:
+                break
+            conflicts += 1
+    out.put(conflicts)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--dashboards", type=int, default=4)
+    p.add_argument("--updates", type=int, default=200)
+    p.add_argument("--ticks", type=int, default=2000)
+    p.add_argument("--flush-every", type=int, default=20)
+    p.add_argument("--legacy", action="store_true")
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.json")
+        with open(path, "w") as f:
+            json.dump({"bot": {}, "dash": {}}, f)
+
+        out = Queue()
+        procs = [Process(target=bot, args=(path, args.ticks, args.flush_every))]
+        procs += [
+            Process(target=dashboard, args=(path, f"w{i}", args.updates, args.legacy, out))
+            for i in range(args.dashboards)
+        ]
+        start = time.perf_counter()
+        for proc in procs:
+            proc.start()
+        conflicts = sum(out.get() for _ in range(args.dashboards))
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - start
+
+        with open(path) as f:
+            state = json.load(f)
+
+    lost_dash = sum(args.updates - state["dash"].get(f"w{i}", 0) for i in range(args.dashboards))
+    lost_bot = args.ticks - state["bot"].get("ticks", 0)
+    print(f"{'legacy' if args.legacy else 'locked'}: {elapsed:.2f}s, dash version {state.get('_versions', {}).get('dash', '-')}, "
+          f"{'torn reads' if args.legacy else '409 retries'} {conflicts}")
+    print(f"lost dashboard updates: {lost_dash} / {args.updates * args.dashboards}")
+    print(f"lost bot ticks: {lost_bot} / {args.ticks}")
+    sys.exit(1 if lost_dash or lost_bot else 0)
+
+
+if __name__ == "__main__":
+    main()
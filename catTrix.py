@@ -1,61 +1,35 @@
 #!/usr/bin/env python3
-import os, json, time, math, asyncio, logging, tempfile
+import os
+from startup import Lazy, startup
+if os.getenv("STARTUP_REPORT") == "1":
+    startup.trace_imports()
+
+import json, time, math, signal, asyncio, logging, tempfile
+from collections import deque
 from dataclasses import dataclass
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
 
 import discord
 from discord.ext import commands
 from discord import app_commands
 from dotenv import load_dotenv
-import httpx
-from gtts import gTTS
-from flask import Flask, render_template, request, jsonify
-import json, os
-
-STATE_FILE = "state.json"
-
-app = Flask(__name__)
-
-def load_state():
-    with open(STATE_FILE, "r") as f:
-        return json.load(f)
-
-def save_state(data):
-    with open(STATE_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-@app.route("/")
-def index():
-    return render_template("index.html")
-
-@app.route("/api/state")
-def get_state():
-    return jsonify(load_state())
-
-@app.route("/api/update", methods=["POST"])
-def update():
-    state = load_state()
-    payload = request.json
-
-    def deep_merge(src, upd):
-        for k, v in upd.items():
-            if isinstance(v, dict) and isinstance(src.get(k), dict):
-                deep_merge(src[k], v)
-            else:
-                src[k] = v
-
-    deep_merge(state, payload)
-    save_state(state)
-    return {"ok": True}
+from assets import AssetCache
+from filters import FilterEngine
+from gateway_profile import GatewayProfile
+from guild_state import GuildStore
+from metrics import metrics, watch_loop_lag
+from ranking import Leaderboard
+from sharding import parse_shard_ids
+from state_store import StateStore
+from storage import legacy_data, open_storage
+from ai_pipeline import (
+    AIPipeline, AIRefused, RateLimiter, ResponseCache, percentile,
+    PRIORITY_CHAT, PRIORITY_COMMAND
+)
+from youtube_api import AsyncYouTube, LiveChat, QuotaTracker, YouTubeAPIError, parse_duration
+from yt_scheduler import PollScheduler
+
+startup.mark("imports")
 
-if __name__ == "__main__":
-    app.run(
-        host=os.getenv("WEB_HOST", "0.0.0.0"),
-        port=int(os.getenv("WEB_PORT", 5000)),
-        debug=False
-    )
 # ======================
 # BASIC SETUP
 # ======================
@@ -66,6 +40,20 @@ log = logging.getLogger("CatTrix")
 STATE_FILE = "state.json"
 ASSETS_DIR = "assets"
 
+# Fire-and-forget tasks, referenced until done (the loop only keeps weak references)
+background_tasks = set()
+
+def spawn(coro, what):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(lambda t: _spawned_done(t, what))
+    return task
+
+def _spawned_done(task, what):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        log.error(f"{what} failed: {task.exception()!r}")
+
 # ======================
 # CONFIG
 # ======================
@@ -74,21 +62,88 @@ class Config:
     token: str = os.getenv("DISCORD_TOKEN")
     ai_key: str = os.getenv("OPENROUTER_API_KEY")
     ai_model: str = os.getenv("OPENROUTER_MODEL")
+    ai_url: str = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
     cooldown: int = int(os.getenv("AI_COOLDOWN", 15))
     max_len: int = int(os.getenv("MAX_MESSAGE_LENGTH", 140))
+    ai_concurrency: int = int(os.getenv("AI_CONCURRENCY", 4))
+    ai_queue_size: int = int(os.getenv("AI_QUEUE_SIZE", 100))
+    ai_max_wait: float = float(os.getenv("AI_MAX_WAIT", 10))
+    ai_guild_per_min: int = int(os.getenv("AI_GUILD_PER_MIN", 20))
+    ai_user_per_min: int = int(os.getenv("AI_USER_PER_MIN", 4))
+    ai_command_per_min: int = int(os.getenv("AI_COMMAND_PER_MIN", 10))
+    ai_cache_size: int = int(os.getenv("AI_CACHE_SIZE", 1000))
+    ai_cache_ttl: int = int(os.getenv("AI_CACHE_TTL", 600))
+    ai_cache_file: str = os.getenv("AI_CACHE_FILE")
+    ai_stream: bool = os.getenv("AI_STREAM", "0") == "1"
+    ai_stream_edit_interval: float = float(os.getenv("AI_STREAM_EDIT_INTERVAL", 1.2))
+    asset_cache_mb: int = int(os.getenv("ASSET_CACHE_MB", 32))
+    join_wave_threshold: int = int(os.getenv("JOIN_WAVE_THRESHOLD", 5))
+    join_wave_window: float = float(os.getenv("JOIN_WAVE_WINDOW", 10))
+    state_flush_interval: float = float(os.getenv("STATE_FLUSH_INTERVAL", 5))
+    state_max_pending: int = int(os.getenv("STATE_MAX_PENDING", 500))
+    storage: str = os.getenv("STORAGE_BACKEND", "json")
+    db_path: str = os.getenv("DB_PATH", "cattrix.db")
+    guilds_dir: str = os.getenv("GUILDS_DIR", "guilds")
+    guild_idle_timeout: int = int(os.getenv("GUILD_IDLE_TIMEOUT", 900))
+    xp_flush_interval: float = float(os.getenv("XP_FLUSH_INTERVAL", 10))
+    xp_max_pending: int = int(os.getenv("XP_MAX_PENDING", 1000))
+    yt_api_url: str = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
+    yt_daily_quota: int = int(os.getenv("YT_DAILY_QUOTA", 10000))
+    yt_poll_budget: int = int(os.getenv("YT_POLL_BUDGET", 5000))
+    yt_min_interval: int = int(os.getenv("YT_MIN_INTERVAL", 60))
+    yt_max_interval: int = int(os.getenv("YT_MAX_INTERVAL", 3600))
+    yt_shorts_max_seconds: int = int(os.getenv("YT_SHORTS_MAX_SECONDS", 60))  # 180 for the newer 3-min Shorts
+    yt_chat_min_interval: float = float(os.getenv("YT_CHAT_MIN_INTERVAL", 1))
+    shard_count: str = os.getenv("SHARD_COUNT", "")  # "" = unsharded, "auto" or N
+    shard_ids: str = os.getenv("SHARD_IDS", "")      # e.g. "0-3", set by sharding.py
+    intents_profile: str = os.getenv("INTENTS_PROFILE", "minimal")  # or "all"
+    max_messages: int = int(os.getenv("MAX_MESSAGES", 100))
+    dashboard: str = os.getenv("DASHBOARD", "")  # "async" = serve it from the bot's loop
+    web_host: str = os.getenv("WEB_HOST", "0.0.0.0")
+    web_port: int = int(os.getenv("WEB_PORT", 5000))
+    metrics_port: int = int(os.getenv("METRICS_PORT", 0))  # /metrics alone, without DASHBOARD=async
+    watchdog: bool = os.getenv("WATCHDOG") == "1"
+    watchdog_threshold: float = float(os.getenv("WATCHDOG_THRESHOLD", 0.25))
+    watchdog_profile_dir: str = os.getenv("WATCHDOG_PROFILE_DIR", "")  # sampling profiler output
+    watchdog_profile_interval: int = int(os.getenv("WATCHDOG_PROFILE_INTERVAL", 60))
 
 cfg = Config()
 
 # ======================
-# STATE HELPERS
+# STATE STORE
 # ======================
-def read_state():
-    with open(STATE_FILE, "r") as f:
-        return json.load(f)
+store = StateStore(STATE_FILE, cfg.state_flush_interval, cfg.state_max_pending)
+
+# Per-guild data (guilds/<id>.json), loaded on first event and dropped when idle
+guilds = GuildStore(cfg.guilds_dir, cfg.state_flush_interval, cfg.guild_idle_timeout)
+
+# XP, levels and warnings (json = per-guild files, sqlite = DB_PATH)
+storage = open_storage(cfg.storage, guilds, cfg.db_path)
+
+async def storage_call(fn, *args):
+    """Run a storage write, in a worker thread when the backend can block (SQLite)."""
+    if storage.blocking:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+legacy_users, legacy_warns = legacy_data(store.data)
+if legacy_users or legacy_warns:
+    log.warning(
+        f"state.json still holds XP for {legacy_users} users and {legacy_warns} warnings "
+        f"from the single-server layout; neither backend reads them. Migrate with "
+        f"`python guild_state.py <guild_id>` (json) or `python storage.py --guild <guild_id>` (sqlite)"
+    )
+leaderboard = Leaderboard(storage)
+startup.mark("state")
 
-def write_state(data):
-    with open(STATE_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+# Blocked words/patterns, recompiled whenever the dashboard edits them
+filters = FilterEngine(store.get("filter"))
+store.on_change("filter", lambda c: spawn(filters.reload(c), "Filter reload"))
+
+# ======================
+# ASSETS (welcome / leave / level-up images)
+# ======================
+assets = AssetCache(ASSETS_DIR, cfg.asset_cache_mb * 1024 * 1024)
 
 # ======================
 # EMBED HELPER (GLOBAL RULE)
@@ -101,6 +156,21 @@ def cattrix_embed(text, color=discord.Color.red(), image=None):
 
 
 
+# ======================
+# YOUTUBE QUOTA
+# ======================
+yt_quota = QuotaTracker(cfg.yt_daily_quota, cfg.yt_poll_budget)
+yt_quota.load(store.get("yt_quota"))
+
+scheduler = PollScheduler(
+    yt_quota,
+    cfg.yt_poll_budget,
+    min_interval=cfg.yt_min_interval,
+    max_interval=cfg.yt_max_interval
+)
+scheduler.load(store.get("yt_schedule"))
+
+
 # ======================
 # OAUTH HELPER 
 # ======================
@@ -108,6 +178,11 @@ def cattrix_embed(text, color=discord.Color.red(), image=None):
 SCOPES = ["https://www.googleapis.com/auth/youtube.force-ssl"]
 
 def get_youtube_oauth():
+    """Blocking: may refresh or open a browser flow. Call through youtube_token()."""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
+
     creds = None
 
     if os.path.exists("token.json"):
@@ -126,78 +201,71 @@ def get_youtube_oauth():
         with open("token.json", "w") as f:
             f.write(creds.to_json())
 
-    return build("youtube", "v3", credentials=creds)
+    return creds
 
+_yt_creds = None
 
-# ======================
-# LIVE CHAT ID
-# ======================
-def get_live_chat_id(youtube, video_id):
-    res = youtube.videos().list(
-        part="liveStreamingDetails",
-        id=video_id
-    ).execute()
+async def youtube_token():
+    global _yt_creds
+    if not _yt_creds or not _yt_creds.valid:
+        _yt_creds = await asyncio.to_thread(get_youtube_oauth)
+    return _yt_creds.token
 
-    items = res.get("items", [])
-    if not items:
-        return None
-
-    return items[0]["liveStreamingDetails"].get("activeLiveChatId")
+# Built on first use: a bot without YouTube channels never creates these clients
+yt_oauth = Lazy(lambda: AsyncYouTube(token=youtube_token, base_url=cfg.yt_api_url, quota=yt_quota))
 
 
 # ======================
 # LIVE CHAT MONITOR 
 # ======================
-async def monitor_live_chat(video_id, discord_channel):
-    youtube = get_youtube_oauth()
-    chat_id = get_live_chat_id(youtube, video_id)
+async def chat_ai_stage(events, chat_id, video_id):
+    """AI replies to chat events, posted back to YouTube. Yields (event, reply)."""
+    async for ev in events:
+        if filters.match("streams", video_id, ev.text):
+            log.info(f"Filtered YT chat message from {ev.author}")
+            continue
 
-    if not chat_id:
-        return
+        try:
+            ai_reply = await ai.reply(
+                ev.text,
+                scope={"channel": f"yt:{chat_id}", "user": f"yt:{ev.author}"}
+            )
+        except AIRefused:
+            continue
+        if not ai_reply:
+            continue
 
-    next_page = None
-
-    while True:
-        res = youtube.liveChatMessages().list(
-            liveChatId=chat_id,
-            part="snippet,authorDetails",
-            pageToken=next_page
-        ).execute()
-
-        for item in res.get("items", []):
-            author = item["authorDetails"]["displayName"]
-            message = item["snippet"]["displayMessage"]
-
-            # AI reply
-            ai_reply = await ai.reply(message, author)
-
-            if ai_reply:
-                # Send reply to YouTube
-                youtube.liveChatMessages().insert(
-                    part="snippet",
-                    body={
-                        "snippet": {
-                            "liveChatId": chat_id,
-                            "type": "textMessageEvent",
-                            "textMessageDetails": {
-                                "messageText": ai_reply
-                            }
-                        }
-                    }
-                ).execute()
-
-                # Log to Discord
-                await discord_channel.send(
-                    embed=cattrix_embed(
-                        f"💬 **YT Live Chat**\n"
-                        f"👤 {author}: {message}\n"
-                        f"🤖 {ai_reply}",
-                        discord.Color.gold()
+        try:
+            await yt_oauth.insert_live_chat_message(chat_id, ai_reply)
+        except Exception as e:
+            log.error(f"YT chat reply failed: {e}")
+        yield ev, ai_reply
+
+async def monitor_live_chat(video_id, discord_channel, chat_id=None):
+    """Follow a stream's chat. True if it ended, False if it stopped early (no chat, quota)."""
+    # Reads use the API key; only replies need OAuth
+    chat = LiveChat(yt_api, video_id, chat_id, min_interval=cfg.yt_chat_min_interval)
+    if not await chat.resolve_chat_id():
+        return False
+
+    events = chat.subscribe()
+    poller = asyncio.create_task(chat.run())
+    try:
+        async for ev, ai_reply in chat_ai_stage(events, chat.chat_id, video_id):
+            # Log to Discord
+            if discord_channel:
+                with metrics.timer("cattrix_discord_send_seconds", kind="live_chat"):
+                    await discord_channel.send(
+                        embed=cattrix_embed(
+                            f"💬 **YT Live Chat**\n"
+                            f"👤 {ev.author}: {ev.text}\n"
+                            f"🤖 {ai_reply}",
+                            discord.Color.gold()
+                        )
                     )
-                )
-
-        next_page = res.get("nextPageToken")
-        await asyncio.sleep(5)
+        return await poller
+    finally:
+        poller.cancel()
 
 
 
@@ -205,70 +273,44 @@ async def monitor_live_chat(video_id, discord_channel):
 # YOUTUBE LIVE KEY
 # ======================
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
-yt_api = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
-
-def get_live_streams(channel_id):
-    res = yt_api.search().list(
-        part="snippet",
-        channelId=channel_id,
-        eventType="live",
-        type="video",
-        maxResults=1
-    ).execute()
-    return res.get("items", [])
+yt_api = Lazy(lambda: AsyncYouTube(api_key=YOUTUBE_API_KEY, base_url=cfg.yt_api_url, quota=yt_quota))
 
 
 # ======================
 # MONITOR LOOP
 # ======================
-active_streams = {}
+yt_wake = asyncio.Event()
+
+def on_yt_channels(channels):
+    scheduler.add(channels)
+    yt_wake.set()
 
 async def youtube_monitor():
+    """Single YouTube poller: checks whichever channels the scheduler says are due."""
     await bot.wait_until_ready()
 
     while not bot.is_closed():
-        state = read_state()
-        yt_channels = state.get("yt_channels", {})
-
-        log_channel_id = state["servers"]["GLOBAL"]["moderation"]["log_channel_id"]
-        discord_channel = bot.get_channel(log_channel_id)
-
-        if not discord_channel:
-            await asyncio.sleep(10)
-            continue
-
-        for channel_id, cfg in yt_channels.items():
-            if not cfg.get("live"):
-                continue
+        yt_channels = store.get("yt_channels", {})
+        scheduler.forget(yt_channels)
+        monitor.forget(yt_channels)
 
-            lives = get_live_streams(channel_id)
-            for live in lives:
-                video_id = live["id"]["videoId"]
-
-                if video_id in active_streams:
-                    continue  # already monitoring
-
-                title = live["snippet"]["title"]
-                url = f"https://youtu.be/{video_id}"
-
-                # Announce in Discord
-                await discord_channel.send(
-                    embed=cattrix_embed(
-                        f"🔴 **LIVE NOW**\n**{title}**\n{url}",
-                        discord.Color.red()
-                    )
-                )
-
-                # Start live chat monitor
-                task = asyncio.create_task(
-                    monitor_live_chat(video_id, discord_channel)
-                )
-                active_streams[video_id] = task
-
-        await asyncio.sleep(60)
+        due = scheduler.due(yt_channels)
+        if due:
+            try:
+                await monitor.check_channels(due)
+            except Exception as e:
+                log.error(f"YT monitor error: {e}")
 
+            store.data["yt_quota"] = yt_quota.to_dict()
+            store.data["yt_schedule"] = scheduler.to_dict()
+            store.mark_dirty("yt_quota", "yt_schedule")
 
-bot.loop.create_task(youtube_monitor())
+        # Sleep until the next check is due, or the dashboard changes the channel list
+        try:
+            await asyncio.wait_for(yt_wake.wait(), scheduler.next_wakeup(yt_channels))
+        except asyncio.TimeoutError:
+            pass
+        yt_wake.clear()
 
 
 
@@ -278,79 +320,311 @@ bot.loop.create_task(youtube_monitor())
 # ======================
 class AIService:
     def __init__(self):
-        self.last = 0
-        self.client = httpx.AsyncClient(timeout=20)
-
-    async def reply(self, msg, author):
-        if time.time() - self.last < cfg.cooldown:
-            return None
-
-        state = read_state()
-        payload = {
+        self._client = None
+        self.pipeline = AIPipeline(
+            self.complete,
+            RateLimiter({
+                "guild": (cfg.ai_guild_per_min / 60, cfg.ai_guild_per_min),
+                "channel": (1 / max(cfg.cooldown, 1), 1),
+                "user": (cfg.ai_user_per_min / 60, cfg.ai_user_per_min),
+                "command": (cfg.ai_command_per_min / 60, cfg.ai_command_per_min),
+            }),
+            concurrency=cfg.ai_concurrency,
+            max_queue=cfg.ai_queue_size,
+            max_wait=cfg.ai_max_wait
+        )
+        self.cache = ResponseCache(cfg.ai_cache_size, cfg.ai_cache_ttl, cfg.ai_cache_file)
+        self.first_token = deque(maxlen=1000)    # request start -> first token (s)
+        self.first_visible = deque(maxlen=1000)  # request start -> first token on Discord (s)
+
+    @property
+    def client(self):
+        # httpx is imported with the first AI request, not at startup
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(timeout=20)
+        return self._client
+
+    async def reply(self, msg, scope=None, priority=PRIORITY_CHAT, on_text=None):
+        """
+        Cached reply, else queue one. Raises AIRefused when rate limited, shed or failed.
+        Cache hits and duplicates of an in-flight prompt never reach the queue.
+        With AI_STREAM=1, on_text(partial) is called as tokens arrive ("" on start).
+        """
+        key = ResponseCache.key(cfg.ai_model, store["personality"], msg)
+        # Only same-priority requests share a call. Joining one still takes the
+        # caller's own rate-limit tokens, and a refusal met by the caller that
+        # queued it is never handed on: the others queue their own request.
+        joined = []
+
+        def join():
+            self.pipeline.admit(scope)
+            joined.append(True)
+
+        def fetch():
+            # Tokens already taken on joining aren't taken again for our own request
+            return self.pipeline.submit(msg, on_text, scope=None if joined else scope, priority=priority)
+
+        return await self.cache.get_or_fetch(key, fetch, lane=priority, refetch_on=(AIRefused,), on_join=join)
+
+    async def complete(self, msg, on_text=None):
+        if on_text and cfg.ai_stream:
+            return await self.request_stream(msg, on_text)
+        return await self.request(msg)
+
+    def _payload(self, msg):
+        return {
             "model": cfg.ai_model,
             "messages": [
                 {
                     "role": "system",
-                    "content": f"You are CatTrix ({state['personality']}). Short replies."
+                    "content": f"You are CatTrix ({store['personality']}). Short replies."
                 },
-                {"role": "user", "content": f"{author}: {msg}"}
+                {"role": "user", "content": msg}
             ],
             "max_tokens": 80
         }
 
-        r = await self.client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={"Authorization": f"Bearer {cfg.ai_key}"},
-            json=payload
-        )
+    async def request(self, msg):
+        with metrics.timer("cattrix_ai_request_seconds", mode="plain"):
+            r = await self.client.post(
+                cfg.ai_url,
+                headers={"Authorization": f"Bearer {cfg.ai_key}"},
+                json=self._payload(msg)
+            )
 
         if r.status_code != 200:
             return None
 
-        self.last = time.time()
         return r.json()["choices"][0]["message"]["content"][:cfg.max_len]
 
+    async def request_stream(self, msg, on_text):
+        """Same as request() but over SSE (stream: true), reporting partial text."""
+        start = time.monotonic()
+        text = ""
+        on_text(text)
+
+        async with self.client.stream(
+            "POST",
+            cfg.ai_url,
+            headers={"Authorization": f"Bearer {cfg.ai_key}"},
+            json={**self._payload(msg), "stream": True}
+        ) as r:
+            if r.status_code != 200:
+                return None
+
+            async for line in r.aiter_lines():
+                # Blank keep-alives and ": OPENROUTER PROCESSING" comments carry no data
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+                if not text:
+                    self.first_token.append(time.monotonic() - start)
+                text += delta
+                on_text(text[:cfg.max_len])
+                if len(text) >= cfg.max_len:
+                    break
+
+        metrics.histogram("cattrix_ai_request_seconds", mode="stream").observe(time.monotonic() - start)
+        return text[:cfg.max_len] or None
+
+    def metrics(self):
+        return {
+            **self.pipeline.metrics(),
+            **{f"cache_{k}": v for k, v in self.cache.metrics().items()},
+            "first_token_p50": percentile(self.first_token, 0.5),
+            "first_visible_p50": percentile(self.first_visible, 0.5),
+            "first_visible_p99": percentile(self.first_visible, 0.99),
+        }
+
 ai = AIService()
 
+# ======================
+# STREAMING REPLIES
+# ======================
+class LiveEdit:
+    """
+    Shows a streamed reply: posts a placeholder embed, then edits it with the
+    latest text at most once per `interval` seconds (Discord allows ~5 edits
+    per 5 s per channel).
+    """
+
+    def __init__(self, send, render, interval=cfg.ai_stream_edit_interval):
+        self.send = send        # async (embed) -> Message
+        self.render = render    # text -> Embed
+        self.interval = interval
+        self.started = time.monotonic()
+        self.message = None
+        self.text = None
+        self.shown = None
+        self._task = None
+        self._done = asyncio.Event()
+
+    def update(self, text):
+        self.text = text
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _show(self, text):
+        if self.message is None:
+            with metrics.timer("cattrix_discord_send_seconds", kind="ai_reply"):
+                self.message = await self.send(self.render(text or "…"))
+        elif text != self.shown:
+            with metrics.timer("cattrix_discord_send_seconds", kind="ai_edit"):
+                await self.message.edit(embed=self.render(text))
+        if text and not self.shown:
+            ai.first_visible.append(time.monotonic() - self.started)
+        self.shown = text
+
+    async def _run(self):
+        while not self._done.is_set():
+            if self.text != self.shown or self.message is None:
+                await self._show(self.text)
+            try:
+                await asyncio.wait_for(self._done.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def finish(self, text):
+        """Show the final text; a placeholder whose request failed is deleted."""
+        self._done.set()
+        if self._task:
+            await self._task
+
+        if text:
+            await self._show(text)
+        elif self.message:
+            await self.message.delete()
+
 # ======================
 # BOT INIT
 # ======================
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Intents follow the features enabled in state.json (toggling one needs a restart)
+gateway = GatewayProfile(store.data, bool(cfg.ai_key), cfg.intents_profile, cfg.max_messages)
+shard_ids = parse_shard_ids(cfg.shard_ids)
+
+if cfg.shard_count:
+    bot = commands.AutoShardedBot(
+        command_prefix="!",
+        shard_count=None if cfg.shard_count == "auto" else int(cfg.shard_count),
+        shard_ids=shard_ids,
+        **gateway.bot_options()
+    )
+else:
+    bot = commands.Bot(command_prefix="!", **gateway.bot_options())
+
+# Process-wide jobs (YouTube polling) run once, in the worker that owns shard 0
+primary = shard_ids is None or 0 in shard_ids
+startup.mark("bot")
 
 # ======================
 # WELCOME / LEAVE
 # ======================
-async def handle_join_leave(member, join=True):
-    state = read_state()
+MAX_WAVE_MENTIONS = 50
+
+async def send_join_leave(guild, members, join=True):
+    """`members` may be Users: leaves arrive as raw events, since members aren't cached."""
+    state = store.data
     cfg = state["welcome"] if join else state["leave"]
-    if not cfg["enabled"]:
-        return
 
-    channel = member.guild.get_channel(cfg["channel_id"])
+    channel = guild.get_channel(cfg["channel_id"])
     if not channel:
         return
 
+    users = ", ".join(m.mention for m in members[:MAX_WAVE_MENTIONS])
+    if len(members) > MAX_WAVE_MENTIONS:
+        users += f" and {len(members) - MAX_WAVE_MENTIONS} more"
+
     text = cfg["message"].format(
-        user=member.mention,
-        server=member.guild.name
+        user=users,
+        server=guild.name
     )
 
     img = cfg.get("image")
-    file = discord.File(f"{ASSETS_DIR}/{img}", filename=img)
+    file = assets.file(img)
 
-    await channel.send(
-        embed=cattrix_embed(text, image=img),
-        file=file
-    )
+    with metrics.timer("cattrix_discord_send_seconds", kind="join_leave"):
+        await channel.send(
+            embed=cattrix_embed(text, image=img if file else None),
+            file=file
+        )
+
+class JoinWave:
+    """
+    Raid/join-wave batching. While a guild sees at most `threshold`
+    joins (or leaves) per `window` seconds, each member gets their own
+    message. Past that, members are collected for one window and greeted
+    in a single embed.
+    """
+
+    def __init__(self, threshold, window):
+        self.threshold = threshold
+        self.window = window
+        self.recent = {}   # (guild_id, join) -> deque of event times
+        self.pending = {}  # (guild_id, join) -> [members]
+        self.tasks = set()  # running _flush_later tasks, referenced until done
+        self.counts = {"sent": 0, "batched": 0, "suppressed": 0}
+
+    async def handle(self, guild, member, join):
+        key = (guild.id, join)
+        now = time.monotonic()
+        recent = self.recent.setdefault(key, deque())
+        recent.append(now)
+        while now - recent[0] > self.window:
+            recent.popleft()
+
+        if key in self.pending:
+            self.pending[key].append(member)
+            return
+        if len(recent) > self.threshold:
+            self.pending[key] = [member]
+            task = asyncio.create_task(self._flush_later(key, guild, join))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            return
+
+        self.counts["sent"] += 1
+        await send_join_leave(guild, [member], join)
+
+    async def _flush_later(self, key, guild, join):
+        await asyncio.sleep(self.window)
+        members = self.pending.pop(key)
+        self.counts["batched"] += 1
+        self.counts["suppressed"] += len(members) - 1
+        try:
+            await send_join_leave(guild, members, join)
+        except discord.HTTPException as e:
+            log.error(f"Join-wave message failed: {e}")
+
+join_wave = JoinWave(cfg.join_wave_threshold, cfg.join_wave_window)
+
+async def handle_join_leave(guild, member, join=True):
+    section = store["welcome"] if join else store["leave"]
+    if not section["enabled"]:
+        return
+    await join_wave.handle(guild, member, join)
 
 @bot.event
 async def on_member_join(member):
-    await handle_join_leave(member, True)
+    await handle_join_leave(member.guild, member, True)
+
+# member_remove only fires for cached members, and the minimal profile caches none
+@bot.event
+async def on_raw_member_remove(payload):
+    guild = bot.get_guild(payload.guild_id)
+    if guild:
+        await handle_join_leave(guild, payload.user, False)
 
+# Rank indexes outlive guild-file eviction; only leaving the guild drops one
 @bot.event
-async def on_member_remove(member):
-    await handle_join_leave(member, False)
+async def on_guild_remove(guild):
+    leaderboard.forget(guild.id)
 
 # ======================
 # LEVEL SYSTEM
@@ -358,6 +632,113 @@ async def on_member_remove(member):
 def get_level(xp):
     return int(math.sqrt(xp / 50))
 
+async def announce_level(msg, level):
+    state = store.data
+    ch = msg.guild.get_channel(state["level"]["channel_id"])
+    if not ch:
+        return
+
+    img = state["level"]["image"]
+    file = assets.file(img)
+    text = state["level"]["message"].format(
+        user=msg.author.mention,
+        level=level
+    )
+    with metrics.timer("cattrix_discord_send_seconds", kind="level_up"):
+        await ch.send(
+            embed=cattrix_embed(text, discord.Color.green(), img if file else None),
+            file=file
+        )
+
+class XPBatcher:
+    """
+    Counts messages per (guild, user) and grants the XP in one batch every
+    `interval` seconds, or early once `max_pending` members are waiting.
+    Every level crossed inside a batch is announced exactly once.
+    """
+
+    def __init__(self, interval, max_pending):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}  # (guild_id, user_id) -> [count, last message]
+        self._wake = None
+
+    def add(self, msg):
+        key = (msg.guild.id, msg.author.id)
+        entry = self.pending.get(key)
+        if entry:
+            entry[0] += 1
+            entry[1] = msg
+        else:
+            self.pending[key] = [1, msg]
+            if len(self.pending) >= self.max_pending and self._wake:
+                self._wake.set()
+
+    def _write(self, batch, per, enabled):
+        """One storage transaction for the batch; returns (new xp totals, level-ups)."""
+        totals, level_ups = [], []
+        with metrics.timer("cattrix_xp_flush_seconds"), storage.transaction():
+            for (gid, uid), (count, msg) in batch.items():
+                xp = storage.add_xp(gid, uid, count * per)
+                totals.append((gid, uid, xp))
+                old = storage.get_level(gid, uid)
+                new = get_level(xp)
+
+                if new > old and enabled:
+                    storage.set_level(gid, uid, new)
+                    level_ups += [(msg, lvl) for lvl in range(old + 1, new + 1)]
+        return totals, level_ups
+
+    def _take(self):
+        batch, self.pending = self.pending, {}
+        level = store.data["level"]
+        return batch, level["xp_per_message"], level["enabled"]
+
+    def _ranked(self, totals, level_ups):
+        for gid, uid, xp in totals:
+            leaderboard.update(gid, uid, xp)
+        return level_ups
+
+    def apply(self):
+        """Write the pending XP; returns [(msg, level), ...] still to announce."""
+        batch, per, enabled = self._take()
+        if not batch:
+            return []
+        return self._ranked(*self._write(batch, per, enabled))
+
+    async def aapply(self):
+        """apply(), with the transaction in a worker thread when storage blocks (SQLite)."""
+        batch, per, enabled = self._take()
+        if not batch:
+            return []
+        return self._ranked(*await storage_call(self._write, batch, per, enabled))
+
+    async def flush(self):
+        for msg, level in await self.aapply():
+            try:
+                await announce_level(msg, level)
+            except discord.HTTPException as e:
+                log.error(f"Level-up announce failed: {e}")
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error(f"XP flush error: {e}")
+
+    def start(self):
+        self._wake = asyncio.Event()
+        return asyncio.create_task(self.run())
+
+xp_batcher = XPBatcher(cfg.xp_flush_interval, cfg.xp_max_pending)
+
 # ======================
 # FULL MODERATION COG
 # ======================
@@ -368,29 +749,38 @@ class Moderation(commands.Cog):
     def _embed(self, t, c=discord.Color.red()):
         return discord.Embed(description=t, color=c)
 
-    def _state(self):
-        return read_state()
-
-    def _save(self, d):
-        write_state(d)
-
-    def _warn(self, g, u, r):
-        d = self._state()
-        warns = d["servers"]["GLOBAL"]["warnings"].setdefault(str(u), [])
-        warns.append({"reason": r, "time": int(time.time())})
-        self._save(d)
-        return len(warns)
+    async def _warn(self, g, u, r):
+        return await storage_call(storage.add_warning, g, u, r)
 
     @app_commands.command(name="warn")
     @app_commands.checks.has_permissions(moderate_members=True)
     async def warn(self, i, m: discord.Member, reason: str):
-        c = self._warn(i.guild.id, m.id, reason)
+        c = await self._warn(i.guild.id, m.id, reason)
         await i.response.send_message(
             embed=self._embed(f"⚠️ {m.mention} warned\nTotal: {c}")
         )
 
 # (Other moderation commands remain unchanged – already validated)
 
+# ======================
+# AUTO MODERATION (filter hits)
+# ======================
+async def auto_moderate(msg, hit):
+    count = await storage_call(storage.add_warning, msg.guild.id, msg.author.id, f"Auto-filter: {hit}")
+
+    if filters.config.get("delete", True):
+        try:
+            await msg.delete()
+        except discord.HTTPException as e:
+            log.warning(f"Could not delete filtered message: {e}")
+
+    metrics.counter("cattrix_filter_hits_total").inc()
+    with metrics.timer("cattrix_discord_send_seconds", kind="auto_mod"):
+        await msg.channel.send(
+            embed=cattrix_embed(f"⚠️ {msg.author.mention} warned: blocked word\nTotal: {count}"),
+            delete_after=10
+        )
+
 # ======================
 # MESSAGE HANDLER (AI + XP)
 # ======================
@@ -399,37 +789,31 @@ async def on_message(msg):
     if msg.author.bot or not msg.guild:
         return
 
-    state = read_state()
-    uid = str(msg.author.id)
-
-    # XP
-    xp = state["stats"]["messages"].get(uid, 0) + state["level"]["xp_per_message"]
-    state["stats"]["messages"][uid] = xp
+    with metrics.timer("cattrix_message_seconds"):
+        # Keeps this guild's shard resident while it is active
+        guilds.get(msg.guild.id)
 
-    old = state["stats"]["levels"].get(uid, 0)
-    new = get_level(xp)
+        # Filter first: a blocked message earns no XP and gets no AI reply
+        hit = filters.match("guilds", msg.guild.id, msg.content)
+        if not hit:
+            # XP (granted in batches by xp_batcher)
+            xp_batcher.add(msg)
 
-    if new > old and state["level"]["enabled"]:
-        state["stats"]["levels"][uid] = new
-        ch = msg.guild.get_channel(state["level"]["channel_id"])
-        if ch:
-            img = state["level"]["image"]
-            file = discord.File(f"{ASSETS_DIR}/{img}", filename=img)
-            text = state["level"]["message"].format(
-                user=msg.author.mention,
-                level=new
-            )
-            await ch.send(
-                embed=cattrix_embed(text, discord.Color.green(), img),
-                file=file
-            )
-
-    write_state(state)
+    if hit:
+        await auto_moderate(msg, hit)
+        return
 
-    # AI
-    reply = await ai.reply(msg.content, msg.author.name)
-    if reply:
-        await msg.channel.send(embed=cattrix_embed(reply))
+    # AI (streamed into a placeholder when AI_STREAM=1)
+    live = LiveEdit(lambda em: msg.channel.send(embed=em), cattrix_embed)
+    try:
+        reply = await ai.reply(
+            msg.content,
+            scope={"guild": msg.guild.id, "channel": msg.channel.id, "user": msg.author.id},
+            on_text=live.update
+        )
+    except AIRefused:
+        reply = None
+    await live.finish(reply)
 
     await bot.process_commands(msg)
 
@@ -555,18 +939,13 @@ async def warn(
     member: discord.Member,
     reason: str
 ):
-    state = read_state()
-    warns = state["servers"]["GLOBAL"]["warnings"].setdefault(
-        str(member.id), []
-    )
-    warns.append({"reason": reason, "time": int(time.time())})
-    write_state(state)
+    count = await storage_call(storage.add_warning, interaction.guild.id, member.id, reason)
 
     await interaction.response.send_message(
         embed=e(
             f"⚠️ Warned {member.mention}\n"
             f"Reason: {reason}\n"
-            f"Total warnings: {len(warns)}"
+            f"Total warnings: {count}"
         )
     )
 
@@ -579,11 +958,7 @@ async def remove_warn(
     interaction: discord.Interaction,
     member: discord.Member
 ):
-    state = read_state()
-    existed = state["servers"]["GLOBAL"]["warnings"].pop(
-        str(member.id), None
-    )
-    write_state(state)
+    existed = await storage_call(storage.clear_warnings, interaction.guild.id, member.id)
 
     msg = (
         f"🧹 Warnings cleared for {member.mention}"
@@ -605,17 +980,27 @@ async def search(
 ):
     await interaction.response.defer()
 
-    reply = await ai.reply(query, interaction.user.name)
-    if not reply:
-        reply = "No result found."
-
-    await interaction.followup.send(
-        embed=e(
+    def render(text):
+        return e(
             f"🔍 **Search Result**\n"
-            f"Query: `{query}`\n\n{reply}",
+            f"Query: `{query}`\n\n{text}",
             discord.Color.gold()
         )
-    )
+
+    live = LiveEdit(lambda em: interaction.followup.send(embed=em, wait=True), render)
+    try:
+        reply = await ai.reply(
+            query,
+            scope={"command": interaction.user.id},
+            priority=PRIORITY_COMMAND,
+            on_text=live.update
+        )
+    except AIRefused as refused:
+        if refused.reason == "rate_limited":
+            reply = f"⏳ You're rate limited. Try again in {math.ceil(refused.retry_after)}s."
+        else:
+            reply = "⚠️ Search is unavailable right now. Try again shortly."
+    await live.finish(reply or "No result found.")
 
 # ======================
 # /PROFILE
@@ -626,10 +1011,10 @@ async def profile(
     member: discord.Member = None
 ):
     member = member or interaction.user
-    state = read_state()
+    gid = interaction.guild.id
 
-    xp = state["stats"]["messages"].get(str(member.id), 0)
-    lvl = state["stats"]["levels"].get(str(member.id), 0)
+    xp = storage.get_xp(gid, member.id)
+    lvl = storage.get_level(gid, member.id)
 
     embed = discord.Embed(
         title=f"{member.name}'s Profile",
@@ -640,15 +1025,36 @@ async def profile(
     embed.add_field(name="XP", value=xp)
     embed.add_field(
         name="Warnings",
-        value=len(
-            state["servers"]["GLOBAL"]["warnings"].get(
-                str(member.id), []
-            )
-        )
+        value=storage.warning_count(gid, member.id)
     )
+    rank, total = await leaderboard.rank(gid, member.id)
+    embed.add_field(name="Rank", value=f"#{rank} / {total}" if rank else "Unranked")
 
     await interaction.response.send_message(embed=embed)
 
+# ======================
+# /LEADERBOARD
+# ======================
+@app_commands.command(name="leaderboard", description="Top members by XP")
+async def leaderboard_cmd(
+    interaction: discord.Interaction,
+    size: app_commands.Range[int, 1, 25] = 10
+):
+    top = await leaderboard.top(interaction.guild.id, size)
+    lines = [
+        f"**#{i}** <@{uid}> — Level {get_level(xp)} (`{xp}` XP)"
+        for i, (uid, xp) in enumerate(top, 1)
+    ]
+
+    await interaction.response.send_message(
+        embed=discord.Embed(
+            title=f"🏆 {interaction.guild.name} Leaderboard",
+            description="\n".join(lines) or "No XP yet.",
+            color=discord.Color.gold()
+        ),
+        allowed_mentions=discord.AllowedMentions.none()
+    )
+
 # ======================
 # /SERVER PROFILE
 # ======================
@@ -662,7 +1068,7 @@ async def server_profile(interaction: discord.Interaction):
     )
     embed.set_thumbnail(url=g.icon.url if g.icon else None)
     embed.add_field(name="Members", value=g.member_count)
-    embed.add_field(name="Owner", value=g.owner.mention)
+    embed.add_field(name="Owner", value=f"<@{g.owner_id}>")
     embed.add_field(
         name="Created",
         value=g.created_at.strftime("%Y-%m-%d")
@@ -673,159 +1079,346 @@ async def server_profile(interaction: discord.Interaction):
 # -------------------------------------------------
 # YouTube API Helper
 # -------------------------------------------------
+VIDEO_PARTS = "snippet,contentDetails,liveStreamingDetails"
+
 class YouTubeService:
-    def __init__(self, api_key):
-        self.api_key = api_key
-        self.youtube = build("youtube", "v3", developerKey=api_key)
-
-    def get_live_streams(self, channel_id):
-        """Return list of live stream videos for a channel."""
-        res = self.youtube.search().list(
-            part="snippet",
-            channelId=channel_id,
-            eventType="live",
-            type="video",
-            maxResults=5
-        ).execute()
-        return res.get("items", [])
-
-    def get_latest_upload(self, channel_id):
-        """Return latest uploaded video."""
-        res = self.youtube.search().list(
-            part="snippet",
-            channelId=channel_id,
-            type="video",
-            order="date",
-            maxResults=1
-        ).execute()
-        return res.get("items", [])
-
-    def get_latest_short(self, channel_id):
-        """Return latest short (based on duration heuristics)."""
-        videos = self.get_latest_upload(channel_id)
-        if not videos:
+    def __init__(self, youtube):
+        self.youtube = youtube
+        self.uploads = {}  # channel_id -> uploads playlist id
+
+    async def get_uploads_playlist(self, channel_id):
+        if channel_id not in self.uploads:
+            res = await self.youtube.channels(part="contentDetails", id=channel_id)
+            items = res.get("items", [])
+            self.uploads[channel_id] = (
+                items[0]["contentDetails"]["relatedPlaylists"]["uploads"]
+                if items else "UU" + channel_id[2:]
+            )
+        return self.uploads[channel_id]
+
+    async def get_recent_uploads(self, channel_id, limit=5, etag=None):
+        """
+        Return (newest video IDs, list ETag) (playlistItems: 1 unit, search
+        would be 100), or None when the list still matches `etag`.
+        """
+        playlist = await self.get_uploads_playlist(channel_id)
+        res = await self.youtube.playlist_items(
+            part="contentDetails",
+            playlistId=playlist,
+            maxResults=limit,
+            etag=etag
+        )
+        if res is None:
             return None
-        return videos[0]  # Same result for simple pipeline
+        return [i["contentDetails"]["videoId"] for i in res.get("items", [])], res.get("etag")
+
+    async def get_videos(self, video_ids):
+        """Return {video_id: video} using batched videos.list calls."""
+        items = await self.youtube.videos_batch(video_ids, VIDEO_PARTS)
+        return {v["id"]: v for v in items}
+
+# Video IDs remembered per channel; enough that a deleted upload can't resurface an old one
+SEEN_PER_CHANNEL = 50
 
 class YouTubeMonitor:
     def __init__(self, bot, yt_service):
         self.bot = bot
         self.yt = yt_service
         self.active_streams = {}  # video_id -> task
+        self.announced = set()    # live video_ids already announced
+
+    def _notify_channel(self):
+        log_channel_id = store["servers"]["GLOBAL"]["moderation"]["log_channel_id"]
+        return self.bot.get_channel(log_channel_id)
+
+    @staticmethod
+    def _entry(cid):
+        # Looked up again after every await: a sync from disk may replace the section
+        return store.data.setdefault("yt_seen", {}).setdefault(cid, {"etag": None, "ids": [], "streams": []})
+
+    def _record(self, cid, vid):
+        ids = self._entry(cid)["ids"]
+        ids.insert(0, vid)
+        del ids[SEEN_PER_CHANNEL:]
+        store.mark_dirty("yt_seen")
+
+    def forget(self, channel_ids):
+        """Drop the seen index of channels removed from the dashboard."""
+        seen = store.data.get("yt_seen", {})
+        gone = set(seen) - set(channel_ids)
+        for cid in gone:
+            del seen[cid]
+        if gone:
+            store.mark_dirty("yt_seen")
+
+    async def check_channels(self, channel_ids=None):
+        """
+        Announce uploads not seen before. Per channel, "yt_seen" keeps the
+        uploads-list ETag, the video IDs already handled and the streams
+        still upcoming/live. An unchanged list (304) or no new IDs means
+        only those streams are looked up again; a channel's first check
+        just records what is already there. Nothing is recorded until the
+        lookup and the posts went through, so a failed poll is retried.
+        """
+        import httpx  # already loaded by the YouTube client; kept off the startup path
+        errors = (YouTubeAPIError, httpx.HTTPError)  # API errors, timeouts, connection failures
+
+        channels = store.get("yt_channels", {})
+        ids = [c for c in (channel_ids or channels) if c in channels]
+
+        lookup = {}  # cid -> (new video ids or None on the first check, ids to look up, list etag)
+        for cid in ids:
+            entry = store.data.get("yt_seen", {}).get(cid)
+            try:
+                res = await self.yt.get_recent_uploads(cid, etag=entry and entry["etag"])
+                scheduler.done(cid, len(channels))
+            except errors as e:
+                scheduler.failed(cid, e, len(channels))
+                if getattr(e, "quota", False):
+                    break
+                continue
+
+            entry = store.data.get("yt_seen", {}).get(cid)
+            if res is None:
+                if entry and entry["streams"]:
+                    lookup[cid] = ([], entry["streams"], entry["etag"])
+                continue
+            video_ids, etag = res
+            if entry is None:
+                lookup[cid] = (None, video_ids, etag)  # only a running stream matters here
+                continue
+            new = [v for v in video_ids if v not in entry["ids"]]
+            if new or entry["streams"]:
+                lookup[cid] = (new, new + entry["streams"], etag)
+            elif etag != entry["etag"]:
+                entry["etag"] = etag
+                store.mark_dirty("yt_seen")
+
+        if not lookup:
+            return
+        try:
+            videos = await self.yt.get_videos(v for _, look, _ in lookup.values() for v in look)
+        except errors as e:
+            for cid in lookup:
+                scheduler.failed(cid, e, len(channels))
+            return
+
+        for cid, (new, look, etag) in lookup.items():
+            opts = channels[cid]
+            entry = self._entry(cid)
+
+            # Live / upcoming streams are re-checked every poll until they end
+            entry["streams"] = []
+            for vid in dict.fromkeys(look):
+                video = videos.get(vid)
+                status = video and video["snippet"].get("liveBroadcastContent")
+                if status not in ("live", "upcoming"):
+                    continue
+                entry["streams"].append(vid)
+                if status == "live" and opts.get("live") and vid not in self.active_streams:
+                    scheduler.record_live(cid)
+                    self.active_streams[vid] = asyncio.create_task(self.monitor_stream(video, cid))
+            if new is None:
+                entry["ids"], entry["etag"] = look[:SEEN_PER_CHANNEL], etag
+            store.mark_dirty("yt_seen")
+            if new is None:
+                continue
 
-    async def check_channels(self):
-        state = read_state()
-        channels = state.get("yt_channels", {})
-        for cid, cfg in channels.items():
-            # Live
-            if cfg.get("live"):
-                lives = self.yt.get_live_streams(cid)
-                for video in lives:
-                    vid = video["id"]["videoId"]
-                    if vid not in self.active_streams:
-                        task = asyncio.create_task(self.monitor_stream(vid, cid))
-                        self.active_streams[vid] = task
-
-            # New Video Upload
-            if cfg.get("videos"):
-                video = self.yt.get_latest_upload(cid)
-                if video:
-                    await self.post_video_notification(cid, video[0])
-
-            # Shorts
-            if cfg.get("shorts"):
-                short = self.yt.get_latest_short(cid)
-                if short:
-                    await self.post_short_notification(cid, short)
-
-    async def monitor_stream(self, video_id, channel_id):
+            # Uploads, oldest first; Shorts are told apart by duration. Each one
+            # is recorded as soon as it is posted, the list etag once all are.
+            try:
+                for vid in reversed(new):
+                    await self.announce_upload(cid, opts, videos.get(vid))
+                    self._record(cid, vid)
+            except discord.HTTPException as e:
+                log.error(f"YT upload announce failed, retrying next poll: {e}")
+                continue
+            self._entry(cid)["etag"] = etag
+            store.mark_dirty("yt_seen")
+
+    async def announce_upload(self, cid, opts, video):
+        if not video or video["snippet"].get("liveBroadcastContent") != "none":
+            return
+        duration = parse_duration(video["contentDetails"].get("duration"))
+        if 0 < duration <= cfg.yt_shorts_max_seconds:
+            if opts.get("shorts"):
+                await self.post_short_notification(cid, video)
+        elif opts.get("videos"):
+            await self.post_video_notification(cid, video)
+
+    async def join_requested(self, streams):
+        """Dashboard "Join Live Chat": follow these videos' chats right away."""
+        ids = [v for v, s in streams.items() if s.get("force_join") and v not in self.active_streams]
+        if not ids:
+            return
+        for vid, video in (await self.yt.get_videos(ids)).items():
+            self.active_streams[vid] = asyncio.create_task(self.monitor_stream(video, None))
+
+    async def post_video_notification(self, channel_id, video):
+        ch = self._notify_channel()
+        if ch:
+            with metrics.timer("cattrix_discord_send_seconds", kind="video"):
+                await ch.send(embed=cattrix_embed(
+                    f"📺 **New Video**\n**{video['snippet']['title']}**\nhttps://youtu.be/{video['id']}",
+                    discord.Color.red()
+                ))
+
+    async def post_short_notification(self, channel_id, video):
+        ch = self._notify_channel()
+        if ch:
+            with metrics.timer("cattrix_discord_send_seconds", kind="short"):
+                await ch.send(embed=cattrix_embed(
+                    f"🎬 **New Short**\n**{video['snippet']['title']}**\nhttps://youtube.com/shorts/{video['id']}",
+                    discord.Color.red()
+                ))
+
+    async def monitor_stream(self, video, channel_id):
+        video_id = video["id"]
         link = f"https://youtu.be/{video_id}"
-        state = read_state()
-        notify_channel_id = state.get("servers", {}).get("GLOBAL", {}).get("log_channel_id")
-        notify_channel = self.bot.get_channel(notify_channel_id)
-        title = self.yt.youtube.videos().list(
-            part="snippet", id=video_id
-        ).execute()["items"][0]["snippet"]["title"]
-
-        # Announce
-        if notify_channel:
-            await notify_channel.send(
-                embed=cattrix_embed(f"🔴 Live Now: **{title}**\n{link}", discord.Color.red())
-            )
+        notify_channel = self._notify_channel()
+        title = video["snippet"]["title"]
+        chat_id = video.get("liveStreamingDetails", {}).get("activeLiveChatId")
+
+        # Announce (once, even if the chat monitor is restarted)
+        if notify_channel and video_id not in self.announced:
+            self.announced.add(video_id)
+            with metrics.timer("cattrix_discord_send_seconds", kind="live_start"):
+                await notify_channel.send(
+                    embed=cattrix_embed(f"🔴 Live Now: **{title}**\n{link}", discord.Color.red())
+                )
 
-        # Loop basic polling for live chat messages (optional)
-        while True:
-            await asyncio.sleep(10)
-            # If stream ends, break
-            stats = self.yt.youtube.videos().list(
-                part="liveStreamingDetails", id=video_id
-            ).execute()["items"][0]["liveStreamingDetails"]
-            if "activeLiveChatId" not in stats:
-                break
-
-            live_chat_id = stats["activeLiveChatId"]
-            messages = self.yt.youtube.liveChatMessages().list(
-                liveChatId=live_chat_id,
-                part="snippet,authorDetails"
-            ).execute()
-
-            for item in messages.get("items", []):
-                text = item["snippet"]["displayMessage"]
-                author = item["authorDetails"]["displayName"]
-                # You can optionally add AI search/response here
+        # Chat runs until the API reports it ended, which is our end-of-stream signal
+        try:
+            ended = await monitor_live_chat(video_id, notify_channel, chat_id)
+        except Exception as e:
+            log.error(f"YT live chat error: {e}")
+            return
+        finally:
+            self.active_streams.pop(video_id, None)
+        if not ended:
+            # Still live as far as we know; the next channel check picks it up again
+            log.info(f"Stopped following chat of {video_id} before the stream ended")
+            return
 
         # Stream ended
-        await notify_channel.send(
-            embed=cattrix_embed(f"🔴 Stream Ended: **{title}**\n{link}", discord.Color.dark_gray())
-        )
-        self.active_streams.pop(video_id, None)
+        if notify_channel:
+            with metrics.timer("cattrix_discord_send_seconds", kind="live_end"):
+                await notify_channel.send(
+                    embed=cattrix_embed(f"🔴 Stream Ended: **{title}**\n{link}", discord.Color.dark_gray())
+                )
 
-monitor = YouTubeMonitor(bot, YouTubeService(os.getenv("YOUTUBE_API_KEY")))
+monitor = YouTubeMonitor(bot, YouTubeService(yt_api))
 
 
 
 # ======================
 # SYNC
 # ======================
-@bot.event
-async def on_ready():
-    log.info("🐱 CatTrix ONLINE")
-
-    # Start periodic YouTube check
-    async def yt_loop():
-        while True:
-            try:
-                await monitor.check_channels()
-            except Exception as e:
-                log.error(f"YT monitor error: {e}")
-            await asyncio.sleep(cfg.poll)
-
-    bot.loop.create_task(yt_loop())
-
 async def ai_search(message):
     # For example: search query + categorize
     prompt = f"Message: {message}\nGive a concise summary:"
-    reply = await ai.reply(prompt, "Searcher")
-    return reply
+    try:
+        return await ai.reply(prompt, priority=PRIORITY_COMMAND)
+    except AIRefused:
+        return None
 
 @bot.event
 async def on_ready():
     await bot.tree.sync()
     print("Slash commands synced")
 
+# Stall detector / sampling profiler, off unless WATCHDOG=1
+watchdog = None
+if cfg.watchdog:
+    from loop_watchdog import LoopWatchdog
+    watchdog = LoopWatchdog(
+        cfg.watchdog_threshold,
+        profile_dir=cfg.watchdog_profile_dir,
+        profile_interval=cfg.watchdog_profile_interval
+    )
+
+# ======================
+# METRICS (read at scrape time)
+# ======================
+metrics.describe("cattrix_ai_rejected_total", "AI requests refused by cooldowns or a full queue")
+for reason in ("rate_limited", "rejected", "expired", "failed"):
+    metrics.counter_fn("cattrix_ai_rejected_total", lambda r=reason: ai.pipeline.counts[r], reason=reason)
+metrics.counter_fn("cattrix_ai_completed_total", lambda: ai.pipeline.counts["completed"])
+metrics.gauge("cattrix_ai_queue_depth", lambda: ai.pipeline.metrics()["queue_depth"])
+metrics.counter_fn("cattrix_ai_cache_hits_total", lambda: ai.cache.hits)
+metrics.counter_fn("cattrix_ai_cache_misses_total", lambda: ai.cache.misses)
+metrics.gauge("cattrix_youtube_quota_used", lambda: yt_quota.used)
+metrics.gauge("cattrix_youtube_quota_remaining", lambda: yt_quota.remaining)
+metrics.gauge("cattrix_guilds_loaded", lambda: len(guilds.guilds))
+metrics.gauge("cattrix_xp_pending", lambda: len(xp_batcher.pending))
+metrics.counter_fn("cattrix_join_waves_total", lambda: join_wave.counts["batched"])
+
 # ======================
 # READY
 # ======================
+@bot.event
+async def setup_hook():
+    # /warn comes from the Moderation cog
+    for command in (ping, nick, ban, kick, timeout, remove_timeout, remove_warn,
+                    search, profile, server_profile, leaderboard_cmd):
+        bot.tree.add_command(command)
+
+    # sharding.py stops workers with SIGTERM; close cleanly so main() runs shutdown()
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.create_task(bot.close())
+        )
+    except NotImplementedError:  # Windows
+        pass
+
+    store.start()
+    guilds.start()
+    xp_batcher.start()
+    asyncio.create_task(watch_loop_lag())
+    if watchdog:
+        watchdog.start()
+    if primary and cfg.dashboard == "async":
+        from web_async import AsyncDashboard  # aiohttp.web is only loaded when used
+        await AsyncDashboard(store, cfg.web_host, cfg.web_port).start()
+    elif cfg.metrics_port:
+        from web_async import MetricsServer
+        await MetricsServer(cfg.web_host, cfg.metrics_port).start()
+    if primary:
+        asyncio.create_task(youtube_monitor())
+        # Dashboard edits arrive through store's change notifications
+        store.on_change("yt_channels", on_yt_channels)
+        store.on_change("streams", lambda s: spawn(monitor.join_requested(s), "Live chat join"))
+
 @bot.event
 async def on_ready():
-    s = read_state()
-    s["bot"]["online"] = True
-    write_state(s)
+    store["bot"]["online"] = True
+    store.mark_dirty("bot")
     await bot.add_cog(Moderation(bot))
-    await bot.tree.sync()
+    if primary:
+        await bot.tree.sync()
     log.info("🐱 CatTrix ONLINE")
+    startup.mark("gateway")
+    startup.report()
+    gateway.report()
 
 # ======================
 # RUN
 # ======================
-bot.run(cfg.token)
+def shutdown():
+    if watchdog:
+        watchdog.close()
+    ai.cache.save()
+    xp_batcher.apply()
+    storage.close()
+    guilds.close()
+    store.close()
+
+def main():
+    try:
+        bot.run(cfg.token)
+    finally:
+        shutdown()
+
+# Importable without connecting (bench/loadtest.py drives the handlers directly)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import re, asyncio, logging
+
+log = logging.getLogger("CatTrix.filter")
+
+
+# ======================
+# TERM COMPILER
+# ======================
+def _trie_regex(node):
+    """Regex source for a char trie ({char: subtree, "": end}), sharing prefixes."""
+    end = "" in node
+    branches = sorted(
+        re.escape(ch) + _trie_regex(child)
+        for ch, child in node.items() if ch != ""
+    )
+    if not branches:
+        return ""
+
+    if len(branches) == 1:
+        body = branches[0]
+    else:
+        body = "(?:" + "|".join(branches) + ")"
+    # Longest match first: the optional tail is greedy
+    return f"(?:{body})?" if end else body
+
+
+def compile_filter(terms=(), patterns=(), name="filter"):
+    """
+    Matchers for a word list plus raw patterns: one regex for all the terms,
+    then one per pattern. Terms are matched case-insensitively on word
+    boundaries, through a prefix trie so the cost per message barely grows
+    with the list length. Patterns are compiled on their own, so a bad one
+    is logged and skipped without disabling the rest.
+    """
+    trie = {}
+    for term in terms:
+        term = term.strip().casefold()
+        if not term:
+            continue
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    matchers = []
+    if trie:
+        matchers.append(re.compile(rf"(?<!\w)(?:{_trie_regex(trie)})(?!\w)", re.IGNORECASE))
+    for pattern in patterns:
+        try:
+            matchers.append(re.compile(pattern, re.IGNORECASE))
+        except re.error as e:
+            log.error(f"Bad filter pattern {pattern!r} in {name}: {e}")
+    return tuple(matchers)
+
+
+# ======================
+# FILTER ENGINE
+# ======================
+class FilterEngine:
+    """
+    Per-scope matchers built from the "filter" section of state.json:
+
+        {"enabled": true, "terms": [...], "patterns": [...],
+         "guilds": {"<guild_id>": {"terms": [...], "patterns": [...]}},
+         "streams": {"<video_id>": {"terms": [...], "patterns": [...]}}}
+
+    The global list is compiled once per edit; a guild or stream with its
+    own list gets a second, small matcher compiled the first time it is seen.
+    """
+
+    def __init__(self, config=None):
+        self.load(config or {})
+
+    def load(self, config):
+        self.config = config
+        self.enabled = bool(config.get("enabled"))
+        self.compiled = {None: self._compile(config, "global")}
+        self.hits = 0
+
+    async def reload(self, config):
+        """load() for a running bot: the big global regex is built off the loop."""
+        fresh = FilterEngine.__new__(FilterEngine)
+        await asyncio.to_thread(fresh.load, config)
+        self.config, self.enabled, self.compiled = fresh.config, fresh.enabled, fresh.compiled
+
+    @staticmethod
+    def _compile(section, name):
+        return compile_filter(section.get("terms", []), section.get("patterns", []), name)
+
+    def _matcher(self, kind, key):
+        cache_key = (kind, str(key))
+        if cache_key not in self.compiled:
+            own = self.config.get(kind, {}).get(str(key))
+            self.compiled[cache_key] = self._compile(own, f"{kind} {key}") if own else ()
+        return self.compiled[cache_key]
+
+    def match(self, kind, key, text):
+        """The offending substring, or None. kind is "guilds" or "streams"."""
+        if not self.enabled or not text:
+            return None
+        for matchers in (self.compiled[None], self._matcher(kind, key)):
+            for matcher in matchers:
+                m = matcher.search(text)
+                if m:
+                    self.hits += 1
+                    return m.group(0)
+        return None
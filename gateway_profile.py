@@ -0,0 +1,72 @@
+import os, logging
+
+import discord
+
+log = logging.getLogger("CatTrix.gateway")
+
+
+def rss_mb():
+    """Resident set size of this process in MiB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ======================
+# INTENTS / CACHE PROFILE
+# ======================
+class GatewayProfile:
+    """
+    Intents and cache settings derived from the features that are switched on.
+
+    Only what a feature needs is requested: guilds always (channels for
+    welcome/level embeds, slash commands), members for welcome/leave, message
+    content for leveling, AI chat and the word filter. Members are never
+    cached or chunked; handlers get them from the event or interaction itself.
+    """
+
+    def __init__(self, state, ai_enabled, mode="minimal", max_messages=100):
+        self.mode = mode
+        self.max_messages = max_messages
+        self.features = {
+            "welcome": state.get("welcome", {}).get("enabled", False),
+            "leave": state.get("leave", {}).get("enabled", False),
+            "leveling": state.get("level", {}).get("enabled", False),
+            "ai_chat": ai_enabled,
+            "filter": state.get("filter", {}).get("enabled", False),
+        }
+
+    @property
+    def intents(self):
+        if self.mode == "all":
+            return discord.Intents.all()
+
+        intents = discord.Intents.none()
+        intents.guilds = True
+        if self.features["welcome"] or self.features["leave"]:
+            intents.members = True
+        if self.features["leveling"] or self.features["ai_chat"] or self.features["filter"]:
+            intents.guild_messages = True
+            intents.message_content = True
+        return intents
+
+    def bot_options(self):
+        if self.mode == "all":
+            return {"intents": self.intents}
+        return {
+            "intents": self.intents,
+            "member_cache_flags": discord.MemberCacheFlags.none(),
+            "chunk_guilds_at_startup": False,
+            "max_messages": self.max_messages or None,
+        }
+
+    def report(self):
+        enabled = [name for name, value in self.intents if value]
+        features = [name for name, on in self.features.items() if on]
+        log.info(
+            f"Gateway profile '{self.mode}': features={features or 'none'} "
+            f"intents={enabled} max_messages={self.max_messages} RSS={rss_mb():.1f} MiB"
+        )
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+import os, json, time, asyncio, logging, argparse
+
+from metrics import metrics
+from state_store import atomic_write
+
+log = logging.getLogger("CatTrix.guilds")
+
+
+def empty_guild():
+    return {"warnings": {}, "stats": {"messages": {}, "levels": {}}}
+
+
+# ======================
+# GUILD SHARDS
+# ======================
+class GuildStore:
+    """
+    Per-guild state, one JSON file per guild under `folder`.
+
+    A guild is read from disk the first time something touches it and
+    dropped again once it has been idle for `idle_timeout` seconds, so
+    memory and flush cost follow the active guilds rather than every guild
+    the bot is in. Dirty guilds are written back by the flush loop; each
+    write only covers that one guild's file.
+    """
+
+    def __init__(self, folder, flush_interval=5.0, idle_timeout=900, on_evict=None):
+        self.folder = folder
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict  # called with guild_id after a guild is dropped
+        self.guilds = {}      # guild_id -> data
+        self.last_used = {}   # guild_id -> monotonic time
+        self.dirty = set()
+        self.loads = 0
+        self.evictions = 0
+        self._wake = None
+        self._task = None
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, guild_id):
+        return os.path.join(self.folder, f"{int(guild_id)}.json")
+
+    def _read(self, guild_id):
+        try:
+            with open(self._path(guild_id), "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return empty_guild()
+        for key, value in empty_guild().items():
+            data.setdefault(key, value)
+        return data
+
+    def get(self, guild_id):
+        gid = int(guild_id)
+        data = self.guilds.get(gid)
+        if data is None:
+            data = self.guilds[gid] = self._read(gid)
+            self.loads += 1
+        self.last_used[gid] = time.monotonic()
+        return data
+
+    def mark_dirty(self, guild_id):
+        self.dirty.add(int(guild_id))
+
+    def _snapshot(self):
+        batch = {gid: json.dumps(self.guilds[gid], indent=2) for gid in self.dirty}
+        self.dirty.clear()
+        return batch
+
+    def flush(self):
+        for gid, text in self._snapshot().items():
+            atomic_write(self._path(gid), text)
+
+    async def aflush(self):
+        """Write every dirty guild; one that fails stays dirty without holding up the rest."""
+        for gid, text in self._snapshot().items():
+            try:
+                with metrics.timer("cattrix_state_flush_seconds", store="guild"):
+                    await asyncio.to_thread(atomic_write, self._path(gid), text)
+            except Exception as e:
+                self.dirty.add(gid)
+                log.error(f"Guild {gid} flush failed: {e}")
+
+    def evict_idle(self):
+        """Drop clean guilds nobody touched for idle_timeout seconds."""
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [g for g, t in self.last_used.items() if t < cutoff and g not in self.dirty]
+        for gid in idle:
+            self.guilds.pop(gid, None)
+            self.last_used.pop(gid, None)
+            if self.on_evict:
+                self.on_evict(gid)
+        self.evictions += len(idle)
+        return len(idle)
+
+    def metrics(self):
+        return {"loaded": len(self.guilds), "dirty": len(self.dirty),
+                "loads": self.loads, "evictions": self.evictions}
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                await self.aflush()
+                self.evict_idle()
+            except Exception as e:
+                log.error(f"Guild flush error: {e}")
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.flush()
+
+
+# ======================
+# MIGRATOR (GLOBAL -> per guild)
+# ======================
+def migrate_global(state, guilds, guild_id):
+    """
+    Move the GLOBAL warnings and stats of a state.json document into one
+    guild. Safe to run again: warnings already there are not added twice.
+    """
+    stats = state.get("stats", {})
+    server = state.get("servers", {}).get("GLOBAL", {})
+
+    data = guilds.get(guild_id)
+    for uid, warns in server.get("warnings", {}).items():
+        have = data["warnings"].setdefault(uid, [])
+        have += [w for w in warns if w not in have]
+    for key in ("messages", "levels"):
+        data["stats"][key].update(stats.get(key, {}))
+
+    guilds.mark_dirty(guild_id)
+    guilds.flush()
+    return len(data["stats"]["messages"]), sum(map(len, data["warnings"].values()))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Split the GLOBAL state.json bucket into a per-guild file")
+    p.add_argument("guild", type=int, help="guild id that owns the legacy GLOBAL data")
+    p.add_argument("--state", default="state.json")
+    p.add_argument("--dir", default=os.getenv("GUILDS_DIR", "guilds"))
+    p.add_argument("--prune", action="store_true",
+                   help="empty the migrated sections in state.json afterwards")
+    args = p.parse_args()
+
+    with open(args.state, "r") as f:
+        state = json.load(f)
+
+    users, warns = migrate_global(state, GuildStore(args.dir), args.guild)
+    print(f"Migrated {users} users and {warns} warnings into {args.dir}/{args.guild}.json")
+
+    if args.prune:
+        state.setdefault("stats", {}).update({"messages": {}, "levels": {}})
+        state.setdefault("servers", {}).setdefault("GLOBAL", {})["warnings"] = {}
+        atomic_write(args.state, json.dumps(state, indent=2))
+        print(f"Pruned migrated sections from {args.state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os, sys, time, asyncio, logging, threading, traceback
+from collections import Counter
+from datetime import datetime
+
+from metrics import metrics
+from state_store import atomic_write
+
+log = logging.getLogger("CatTrix.watchdog")
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _task_name(task):
+    if task is None:
+        return "no task (plain callback)"
+    coro = task.get_coro()
+    return f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+
+
+# ======================
+# LOOP WATCHDOG
+# ======================
+class LoopWatchdog:
+    """
+    Opt-in stall detector (WATCHDOG=1).
+
+    A heartbeat coroutine stamps the time every `interval` seconds; a
+    separate thread checks the stamp, and once it is older than `threshold`
+    the loop is stuck inside one callback. The thread then grabs the loop
+    thread's current stack and the running task, which names the handler
+    that blocked it, and logs them once per stall.
+
+    With `profile_dir` set, the thread also samples the loop thread's stack
+    `sample_hz` times a second and writes the counts every `profile_interval`
+    seconds as collapsed stacks (profile-<time>.folded) for flamegraph.pl or
+    speedscope.
+    """
+
+    def __init__(self, threshold=0.25, interval=0.05, profile_dir="",
+                 profile_interval=60, sample_hz=100):
+        self.threshold = threshold
+        self.interval = interval
+        self.profile_dir = profile_dir
+        self.profile_interval = profile_interval
+        self.sample_hz = sample_hz
+        self.beat = time.monotonic()
+        self.stalls = 0
+        self.samples = Counter()
+        self._loop = None
+        self._thread_id = None
+        self._stop = threading.Event()
+        metrics.describe("cattrix_watchdog_stalls_total", f"Callbacks that held the loop over {threshold}s")
+        metrics.counter_fn("cattrix_watchdog_stalls_total", lambda: self.stalls)
+
+    async def heartbeat(self):
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _loop_frame(self):
+        return sys._current_frames().get(self._thread_id)
+
+    def _report(self, stalled):
+        frame = self._loop_frame()
+        if frame is None:
+            return
+        task = asyncio.current_task(self._loop)
+        stack = "".join(traceback.format_stack(frame))
+        self.stalls += 1
+        log.warning(
+            f"Event loop blocked for {stalled:.2f}s+ in {_task_name(task)}, "
+            f"at {_frame_name(frame)}\n{stack}"
+        )
+
+    def _sample(self):
+        frame = self._loop_frame()
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        # The idle loop sits in select(); only count time spent doing work
+        if stack and not stack[0].startswith("selectors.py"):
+            self.samples[";".join(reversed(stack))] += 1
+
+    def _write_profile(self):
+        samples, self.samples = self.samples, Counter()
+        if not samples:
+            return
+        name = f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+        text = "".join(f"{stack} {n}\n" for stack, n in samples.most_common())
+        atomic_write(os.path.join(self.profile_dir, name), text)
+
+    def _watch(self):
+        tick = 1 / self.sample_hz if self.profile_dir else self.interval
+        reported = None  # beat value of the stall already logged
+        next_profile = time.monotonic() + self.profile_interval
+
+        while not self._stop.wait(tick):
+            now = time.monotonic()
+            beat = self.beat
+            if now - beat > self.threshold and beat != reported:
+                reported = beat
+                self._report(now - beat)
+
+            if self.profile_dir:
+                self._sample()
+                if now >= next_profile:
+                    next_profile = now + self.profile_interval
+                    try:
+                        self._write_profile()
+                    except OSError as e:
+                        log.error(f"Profile snapshot failed: {e}")
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        # Also have asyncio name slow callbacks when it runs in debug mode
+        self._loop.slow_callback_duration = self.threshold
+        task = asyncio.create_task(self.heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        log.info(f"Loop watchdog on: threshold={self.threshold}s profile_dir={self.profile_dir or 'off'}")
+        return task
+
+    def close(self):
+        self._stop.set()
+        if self.profile_dir:
+            self._write_profile()
@@ -0,0 +1,162 @@
+import time, asyncio, logging
+from bisect import bisect_left
+
+log = logging.getLogger("CatTrix.metrics")
+
+# Seconds; covers a dict update up to a slow upstream call
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+# ======================
+# METRIC TYPES
+# ======================
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self, name, labels):
+        yield f"{name}{_labels(labels)} {self.value}"
+
+
+class Histogram:
+    """Fixed buckets; observe() is a bisect and two increments."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        total = 0
+        for bound, n in zip(self.buckets + ("+Inf",), self.counts):
+            total += n
+            yield f"{name}_bucket{_labels({**labels, 'le': bound})} {total}"
+        yield f"{name}_sum{_labels(labels)} {self.sum:.6f}"
+        yield f"{name}_count{_labels(labels)} {self.count}"
+
+
+class Timer:
+    """`with metrics.timer(...)`: a plain class, cheaper than @contextmanager."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Gauge:
+    """Value read from a callback at scrape time, so nothing is paid per event."""
+
+    kind = "gauge"
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def samples(self, name, labels):
+        try:
+            value = self.fn()
+        except Exception as e:
+            log.warning(f"Gauge {name} failed: {e}")
+            return
+        yield f"{name}{_labels(labels)} {value}"
+
+
+class CounterFn(Gauge):
+    """A count some other object already keeps, exposed as a counter."""
+
+    kind = "counter"
+
+
+# ======================
+# REGISTRY
+# ======================
+class Registry:
+    """
+    Process-wide metrics, rendered in the Prometheus text format.
+    Each (name, labels) pair is created on first use and then reused.
+    """
+
+    def __init__(self):
+        self.families = {}  # name -> (type, {labels tuple: metric})
+        self.help = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def _get(self, kind, cls, name, labels, *args):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = (kind, {})
+        key = tuple(sorted(labels.items()))
+        metric = family[1].get(key)
+        if metric is None:
+            metric = family[1][key] = cls(*args)
+        return metric
+
+    def counter(self, name, **labels):
+        return self._get("counter", Counter, name, labels)
+
+    def histogram(self, name, **labels):
+        return self._get("histogram", Histogram, name, labels)
+
+    def gauge(self, name, fn, **labels):
+        return self._get("gauge", Gauge, name, labels, fn)
+
+    def counter_fn(self, name, fn, **labels):
+        return self._get("counter", CounterFn, name, labels, fn)
+
+    def timer(self, name, **labels):
+        return Timer(self.histogram(name, **labels))
+
+    def render(self):
+        lines = []
+        for name, (kind, children) in sorted(self.families.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in children.items():
+                lines.extend(metric.samples(name, dict(key)))
+        return "\n".join(lines) + "\n"
+
+
+metrics = Registry()
+
+
+# ======================
+# EVENT LOOP LAG
+# ======================
+async def watch_loop_lag(interval=0.5, threshold=0.1):
+    """Sleep `interval` seconds at a time; any overshoot is time the loop was blocked."""
+    metrics.describe("cattrix_loop_lag_seconds", "Event loop scheduling delay")
+    metrics.describe("cattrix_loop_stalls_total", f"Loop delays over {threshold}s")
+    lag = metrics.histogram("cattrix_loop_lag_seconds")
+    stalls = metrics.counter("cattrix_loop_stalls_total")
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        delay = max(loop.time() - start - interval, 0)
+        lag.observe(delay)
+        if delay > threshold:
+            stalls.inc()
@@ -0,0 +1,141 @@
+import asyncio
+from bisect import bisect_left, insort
+
+
+# ======================
+# RANK INDEX
+# ======================
+class RankIndex:
+    """
+    Users of one guild ordered by XP, kept sorted as XP changes.
+
+    Keys are (-xp, user_id) stored in chunks of at most `load` items, so an
+    update is two bisects plus a short list shift, and a rank lookup is a
+    bisect plus summing chunk lengths: no full sort, ever.
+    """
+
+    def __init__(self, items=(), load=1000):
+        self.load = load
+        self.xp = {int(uid): xp for uid, xp in items}
+        keys = sorted((-xp, uid) for uid, xp in self.xp.items())
+        self.chunks = [keys[i:i + load] for i in range(0, len(keys), load)] or [[]]
+        self.maxes = [c[-1] for c in self.chunks if c]
+
+    def __len__(self):
+        return len(self.xp)
+
+    def _chunk(self, key):
+        i = bisect_left(self.maxes, key)
+        return min(i, len(self.chunks) - 1)
+
+    def _add(self, key):
+        i = self._chunk(key)
+        chunk = self.chunks[i]
+        insort(chunk, key)
+        if len(self.maxes) <= i:
+            self.maxes.append(chunk[-1])
+        else:
+            self.maxes[i] = chunk[-1]
+
+        if len(chunk) > 2 * self.load:
+            self.chunks[i:i + 1] = [chunk[:self.load], chunk[self.load:]]
+            self.maxes[i:i + 1] = [chunk[self.load - 1], chunk[-1]]
+
+    def _remove(self, key):
+        i = self._chunk(key)
+        chunk = self.chunks[i]
+        del chunk[bisect_left(chunk, key)]
+        if chunk:
+            self.maxes[i] = chunk[-1]
+        elif len(self.chunks) > 1:
+            del self.chunks[i]
+            del self.maxes[i]
+        else:
+            self.maxes = []
+
+    def set(self, user_id, xp):
+        uid = int(user_id)
+        old = self.xp.get(uid)
+        if old == xp:
+            return
+        if old is not None:
+            self._remove((-old, uid))
+        self._add((-xp, uid))
+        self.xp[uid] = xp
+
+    def rank(self, user_id):
+        """1-based rank (ties share a rank), or None if the user has no XP."""
+        xp = self.xp.get(int(user_id))
+        if xp is None:
+            return None
+        key = (-xp, -1)
+        i = self._chunk(key)
+        return sum(len(c) for c in self.chunks[:i]) + bisect_left(self.chunks[i], key) + 1
+
+    def top(self, n=10):
+        out = []
+        for chunk in self.chunks:
+            for neg_xp, uid in chunk:
+                if len(out) == n:
+                    return out
+                out.append((uid, -neg_xp))
+        return out
+
+
+# ======================
+# LEADERBOARD
+# ======================
+class Leaderboard:
+    """
+    Per-guild RankIndex, built from storage on first use and updated on every
+    XP grant. Building sorts every member of the guild, so it runs in a
+    worker thread; grants that land meanwhile are replayed onto the result.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.guilds = {}
+        self.building = {}  # guild_id -> (build task, {user_id: xp} granted meanwhile)
+
+    async def _build(self, guild_id):
+        if getattr(self.storage, "blocking", False):
+            items = await asyncio.to_thread(self.storage.all_xp, guild_id)
+        else:
+            items = self.storage.all_xp(guild_id)
+        return await asyncio.to_thread(RankIndex, items)
+
+    async def _index(self, guild_id):
+        index = self.guilds.get(guild_id)
+        if index is not None:
+            return index
+
+        if guild_id not in self.building:
+            self.building[guild_id] = (asyncio.ensure_future(self._build(guild_id)), {})
+        task, granted = self.building[guild_id]
+        try:
+            index = await asyncio.shield(task)
+        finally:
+            if task.done():
+                self.building.pop(guild_id, None)
+        if guild_id not in self.guilds:
+            for uid, xp in granted.items():
+                index.set(uid, xp)
+            self.guilds[guild_id] = index
+        return self.guilds[guild_id]
+
+    def update(self, guild_id, user_id, xp):
+        index = self.guilds.get(guild_id)
+        if index is not None:
+            index.set(user_id, xp)
+        elif guild_id in self.building:
+            self.building[guild_id][1][user_id] = xp
+
+    def forget(self, guild_id):
+        self.guilds.pop(guild_id, None)
+
+    async def top(self, guild_id, n=10):
+        return (await self._index(guild_id)).top(n)
+
+    async def rank(self, guild_id, user_id):
+        index = await self._index(guild_id)
+        return index.rank(user_id), len(index)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Multi-process launcher: N catTrix.py workers, each owning a slice of the
+gateway shards.
+
+    python sharding.py --workers 4 [--shards 16]
+
+Guilds never move between shards, so per-guild data (guilds/<id>.json,
+leaderboards) is only ever touched by one process. XP/warnings default to
+the SQLite backend, which is safe to share between processes.
+"""
+import os, sys, time, signal, logging, argparse, subprocess
+
+log = logging.getLogger("CatTrix.shards")
+
+
+def parse_shard_ids(text):
+    """'0-3,6' -> [0, 1, 2, 3, 6]; empty -> None (all shards)."""
+    if not text:
+        return None
+    ids = []
+    for part in text.split(","):
+        lo, _, hi = part.partition("-")
+        ids += range(int(lo), int(hi or lo) + 1)
+    return ids
+
+
+def shard_ranges(shards, workers):
+    """Split shards 0..shards-1 into `workers` contiguous 'a-b' ranges."""
+    workers = min(workers, shards)
+    size, extra = divmod(shards, workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        end = start + size + (i < extra)
+        ranges.append(f"{start}-{end - 1}")
+        start = end
+    return ranges
+
+
+def shard_for(guild_id, shards):
+    return (int(guild_id) >> 22) % shards
+
+
+def recommended_shards(token):
+    import httpx
+    r = httpx.get(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}"},
+        timeout=10
+    )
+    r.raise_for_status()
+    return r.json()["shards"]
+
+
+def spawn(shards, ids):
+    env = dict(os.environ, SHARD_COUNT=str(shards), SHARD_IDS=ids)
+    env.setdefault("STORAGE_BACKEND", "sqlite")
+    if env.get("METRICS_PORT"):
+        # One scrape target per worker: METRICS_PORT + first shard id
+        env["METRICS_PORT"] = str(int(env["METRICS_PORT"]) + parse_shard_ids(ids)[0])
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catTrix.py")
+    log.info(f"Starting worker for shards {ids}")
+    return subprocess.Popen([sys.executable, script], env=env)
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    p = argparse.ArgumentParser(description="Run CatTrix as several sharded worker processes")
+    p.add_argument("--workers", type=int, default=os.cpu_count())
+    p.add_argument("--shards", type=int, default=0,
+                   help="total shard count (default: Discord's recommendation)")
+    p.add_argument("--restart-delay", type=float, default=5)
+    args = p.parse_args()
+
+    shards = args.shards or recommended_shards(os.getenv("DISCORD_TOKEN"))
+    workers = {ids: spawn(shards, ids) for ids in shard_ranges(shards, args.workers)}
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for proc in workers.values():
+            proc.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        time.sleep(1)
+        for ids, proc in list(workers.items()):
+            code = proc.poll()
+            if code is None:
+                continue
+            if stopping or code == 0:
+                del workers[ids]
+                continue
+            log.warning(f"Worker {ids} exited with {code}, restarting")
+            time.sleep(args.restart_delay)
+            workers[ids] = spawn(shards, ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import sys, time, builtins, logging
+
+log = logging.getLogger("CatTrix.startup")
+
+T0 = time.perf_counter()
+
+
+# ======================
+# LAZY OBJECTS
+# ======================
+class Lazy:
+    """
+    Stands in for an object that is only built the first time an attribute
+    is used, so features that never run never pay for their imports/clients.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+
+    @property
+    def built(self):
+        return self._obj is not None
+
+    def __getattr__(self, name):
+        if self._obj is None:
+            self._obj = self._factory()
+        return getattr(self._obj, name)
+
+
+# ======================
+# STARTUP REPORT
+# ======================
+class StartupReport:
+    """
+    Phase marks since process start, plus (with STARTUP_REPORT=1) a
+    `python -X importtime`-style table of the slowest top-level imports.
+    """
+
+    def __init__(self):
+        self.marks = []
+        self.reported = False
+        self.imports = {}  # module -> seconds, including its own imports
+        self._import = None
+
+    def mark(self, phase):
+        self.marks.append((phase, time.perf_counter()))
+
+    def trace_imports(self):
+        original = self._import = builtins.__import__
+        depth = [0]
+
+        def timed_import(name, *args, **kwargs):
+            if name in sys.modules or depth[0]:
+                return original(name, *args, **kwargs)
+            depth[0] += 1
+            t = time.perf_counter()
+            try:
+                return original(name, *args, **kwargs)
+            finally:
+                depth[0] -= 1
+                self.imports[name] = time.perf_counter() - t
+
+        builtins.__import__ = timed_import
+
+    def stop_tracing(self):
+        if self._import:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def report(self, top=10):
+        """Log once; on_ready fires again on every reconnect."""
+        if self.reported:
+            return
+        self.reported = True
+        self.stop_tracing()
+        prev = T0
+        phases = []
+        for phase, t in self.marks:
+            phases.append(f"{phase} {(t - prev) * 1000:.0f} ms")
+            prev = t
+        log.info(f"Startup {(prev - T0) * 1000:.0f} ms: " + ", ".join(phases))
+
+        slowest = sorted(self.imports.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        for name, seconds in slowest:
+            log.info(f"  import {name:<28} {seconds * 1000:7.1f} ms")
+
+
+startup = StartupReport()
@@ -0,0 +1,354 @@
+import os, glob, gzip, json, socket, asyncio, hashlib, logging, tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+from metrics import metrics
+
+log = logging.getLogger("CatTrix.state")
+
+
+# ======================
+# ATOMIC WRITE
+# ======================
+def atomic_write(path, text):
+    """Write text to path via temp file + rename so readers never see a partial file."""
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=".state-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+# ======================
+# SHARED WRITE PATH (bot + dashboard)
+# ======================
+class VersionConflict(Exception):
+    def __init__(self, versions):
+        super().__init__(f"state.json sections changed: {versions}")
+        self.versions = versions
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock on <path>.lock, held across processes."""
+    with open(path + ".lock", "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def deep_merge(src, upd):
+    for k, v in upd.items():
+        if isinstance(v, dict) and isinstance(src.get(k), dict):
+            deep_merge(src[k], v)
+        else:
+            src[k] = v
+
+
+def update_state(path, apply, expected=None, bump=()):
+    """
+    Locked read-modify-write of state.json. apply(data) edits the document
+    in place. "_versions" holds a counter per section, bumped for the
+    sections in `bump` (dashboard edits; the bot's own flushes bump
+    nothing). With `expected` ({section: version}) the write only happens
+    if those sections are still at those versions, otherwise
+    VersionConflict is raised. Returns the written document.
+    """
+    with file_lock(path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        data.pop("_version", None)  # single document-wide counter of older releases
+        versions = data.setdefault("_versions", {})
+        if expected and any(versions.get(k, 0) != v for k, v in expected.items()):
+            raise VersionConflict(versions)
+
+        apply(data)
+        for section in bump:
+            versions[section] = versions.get(section, 0) + 1
+        atomic_write(path, json.dumps(data, indent=2))
+        return data
+
+
+def dashboard_update(path, payload):
+    """
+    /api/update for both dashboards: deep-merge `payload` into state.json.
+    "_versions" in the payload makes it conditional on those sections.
+    """
+    expected = payload.pop("_versions", None)
+    sections = [k for k in payload if not k.startswith("_")]
+    return update_state(path, lambda data: deep_merge(data, payload), expected, bump=sections)
+
+
+# ======================
+# CHANGE NOTIFICATIONS (dashboard -> bot)
+# ======================
+def notify_dir(path):
+    return path + ".notify"
+
+
+def notify_change(path):
+    """
+    Poke every running bot process: one datagram per socket in
+    <path>.notify/. Sockets nobody listens on any more are removed.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return
+    msg = b"changed"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        for target in glob.glob(os.path.join(notify_dir(path), "*.sock")):
+            try:
+                sock.sendto(msg, target)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(target)
+                except OSError:
+                    pass
+            except OSError:
+                pass  # queue full: the bot is already behind on a sync
+
+
+# ======================
+# STATE STORE
+# ======================
+class StateStore:
+    """
+    Process-wide copy of state.json kept in memory.
+
+    Handlers mutate ``store.data`` and call ``mark_dirty(section)``; the
+    flush loop writes those sections back at most every ``flush_interval``
+    seconds, or sooner once ``max_pending`` changes have piled up. That pair
+    is the bound on what a crash can lose.
+    """
+
+    def __init__(self, path, flush_interval=5.0, max_pending=500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.data = {}
+        self.dirty = set()
+        self.pending = 0
+        self._mtime = None
+        self._wake = None
+        self._task = None
+        self._listener = None
+        self._sock_path = None
+        self.watchers = {}  # section -> [callback(value)]
+        self.revision = 0    # bumped on every change, from handlers or from disk
+        self.revisions = {}  # section -> revision of its last change
+        self.load()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        with open(self.path, "r") as f:
+            self.data = json.load(f)
+        self._mtime = self._stat()
+        self._touch(self.data)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def _touch(self, sections):
+        self.revision += 1
+        for section in sections:
+            self.revisions[section] = self.revision
+
+    def mark_dirty(self, *sections):
+        self.dirty.update(sections)
+        self._touch(sections)
+        self.pending += 1
+        if self.pending >= self.max_pending and self._wake:
+            self._wake.set()
+
+    def on_change(self, section, callback):
+        """callback(new_value) runs whenever another process changes `section`."""
+        self.watchers.setdefault(section, []).append(callback)
+
+    def _apply_disk(self, disk, skip=()):
+        changed = []
+        for key, value in disk.items():
+            if key not in self.dirty and key not in skip and self.data.get(key) != value:
+                self.data[key] = value
+                changed.append(key)
+        if changed:
+            self._touch(changed)
+        for key in changed:
+            for callback in self.watchers.get(key, ()):
+                try:
+                    callback(self.data[key])
+                except Exception as e:
+                    log.error(f"State watcher for {key} failed: {e}")
+        return changed
+
+    def sync_external(self):
+        """Pick up edits made by the dashboard without clobbering our unsaved sections."""
+        mtime = self._stat()
+        if mtime is None or mtime == self._mtime:
+            return False
+
+        with metrics.timer("cattrix_state_read_seconds"):
+            with open(self.path, "r") as f:
+                disk = json.load(f)
+        self._apply_disk(disk)
+        self._mtime = mtime
+        return True
+
+    def _snapshot(self):
+        # Deep copies, so the write can run off the loop while handlers keep mutating
+        sections = {k: json.loads(json.dumps(self.data[k])) for k in self.dirty if k in self.data}
+        self.dirty.clear()
+        self.pending = 0
+        return sections
+
+    def _commit(self, sections):
+        """Write only our dirty sections; everything else stays as the dashboard left it."""
+        return update_state(self.path, lambda data: data.update(sections))
+
+    def _merge(self, disk, written):
+        # Sections we just wrote are ours: disk holds our snapshot of them, and
+        # handlers may have changed the live objects since it was taken
+        self._apply_disk(disk, skip=written)
+        self._mtime = None  # re-check on the next sync; someone may have written since
+
+    def flush(self):
+        if not self.dirty:
+            return False
+        sections = self._snapshot()
+        self._merge(self._commit(sections), sections)
+        return True
+
+    async def aflush(self):
+        """Snapshot on the loop, locked write from a worker thread."""
+        if not self.dirty:
+            return False
+        sections = self._snapshot()
+        try:
+            with metrics.timer("cattrix_state_flush_seconds", store="state"):
+                disk = await asyncio.to_thread(self._commit, sections)
+        except Exception:
+            self.dirty |= set(sections)
+            raise
+        self._merge(disk, sections)
+        return True
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                self.sync_external()
+                await self.aflush()
+            except Exception as e:
+                log.error(f"State flush error: {e}")
+
+    async def listen(self):
+        """Sync as soon as a notify_change() datagram arrives (Unix only)."""
+        if not hasattr(socket, "AF_UNIX"):
+            return
+        store = self
+
+        class Notified(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                try:
+                    store.sync_external()
+                except Exception as e:
+                    log.error(f"State sync error: {e}")
+
+        os.makedirs(notify_dir(self.path), exist_ok=True)
+        self._sock_path = os.path.join(notify_dir(self.path), f"{os.getpid()}.sock")
+        if os.path.exists(self._sock_path):
+            os.unlink(self._sock_path)
+        self._listener, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            Notified, local_addr=self._sock_path, family=socket.AF_UNIX
+        )
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+        asyncio.create_task(self.listen())
+        return self._task
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._listener:
+            self._listener.close()
+            self._listener = None
+        if self._sock_path and os.path.exists(self._sock_path):
+            os.unlink(self._sock_path)
+        self.flush()
+
+
+# ======================
+# DASHBOARD READ CACHE
+# ======================
+class StateReader:
+    """
+    Read side for the dashboard. state.json is parsed again only when its
+    mtime/size change; each section's encoded body, ETag and gzip copy are
+    built on first request and reused until then.
+    """
+
+    def __init__(self, path, gzip_min=1024):
+        self.path = path
+        self.gzip_min = gzip_min
+        self.data = {}
+        self._stamp = None
+        self._encoded = {}  # section (None = whole document) -> [etag, body, gzipped]
+
+    def refresh(self):
+        st = os.stat(self.path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != self._stamp:
+            with open(self.path, "r") as f:
+                self.data = json.load(f)
+            self._stamp = stamp
+            self._encoded = {}
+        return self.data
+
+    def encoded(self, section=None):
+        """[etag, body, gzip] for a section or the whole document; None if there is no such section."""
+        self.refresh()
+        entry = self._encoded.get(section)
+        if entry is None:
+            if section is not None and section not in self.data:
+                return None
+            body = json.dumps(self.data if section is None else self.data[section]).encode()
+            etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+            entry = self._encoded[section] = [etag, body, None]
+        return entry
+
+    def gzipped(self, entry):
+        """Compressed body, or None when it is too small to be worth it."""
+        if len(entry[1]) < self.gzip_min:
+            return None
+        if entry[2] is None:
+            entry[2] = gzip.compress(entry[1], 6, mtime=0)
+        return entry[2]
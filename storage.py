@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+import os, json, time, sqlite3, logging, argparse, threading
+from contextlib import contextmanager
+
+from state_store import atomic_write
+
+log = logging.getLogger("CatTrix.storage")
+
+
+# ======================
+# JSON BACKEND (per-guild files)
+# ======================
+class JsonStorage:
+    """XP, levels and warnings kept in each guild's GuildStore file."""
+
+    blocking = False  # in-memory; GuildStore is not thread-safe, so stays on the loop
+
+    def __init__(self, guilds):
+        self.guilds = guilds
+
+    def _stats(self, guild_id, key):
+        return self.guilds.get(guild_id)["stats"][key]
+
+    def _warnings(self, guild_id):
+        return self.guilds.get(guild_id)["warnings"]
+
+    def get_xp(self, guild_id, user_id):
+        return self._stats(guild_id, "messages").get(str(user_id), 0)
+
+    def add_xp(self, guild_id, user_id, amount):
+        xp = self._stats(guild_id, "messages")
+        uid = str(user_id)
+        xp[uid] = xp.get(uid, 0) + amount
+        self.guilds.mark_dirty(guild_id)
+        return xp[uid]
+
+    def all_xp(self, guild_id):
+        return [(int(uid), xp) for uid, xp in self._stats(guild_id, "messages").items()]
+
+    def get_level(self, guild_id, user_id):
+        return self._stats(guild_id, "levels").get(str(user_id), 0)
+
+    def set_level(self, guild_id, user_id, level):
+        self._stats(guild_id, "levels")[str(user_id)] = level
+        self.guilds.mark_dirty(guild_id)
+
+    def add_warning(self, guild_id, user_id, reason, ts=None):
+        warns = self._warnings(guild_id).setdefault(str(user_id), [])
+        warns.append({"reason": reason, "time": int(ts or time.time())})
+        self.guilds.mark_dirty(guild_id)
+        return len(warns)
+
+    def warning_count(self, guild_id, user_id):
+        return len(self._warnings(guild_id).get(str(user_id), []))
+
+    def clear_warnings(self, guild_id, user_id):
+        existed = self._warnings(guild_id).pop(str(user_id), None)
+        self.guilds.mark_dirty(guild_id)
+        return bool(existed)
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def close(self):
+        pass
+
+
+# ======================
+# SQLITE BACKEND
+# ======================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS xp (
+    guild_id INTEGER NOT NULL,
+    user_id  INTEGER NOT NULL,
+    xp       INTEGER NOT NULL DEFAULT 0,
+    level    INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS warnings (
+    id       INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    user_id  INTEGER NOT NULL,
+    reason   TEXT NOT NULL,
+    time     INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS warnings_member ON warnings (guild_id, user_id);
+"""
+
+
+class SqliteStorage:
+    """
+    Per-(guild, user) rows in SQLite. Every call is a single indexed
+    statement, so cost does not grow with the number of tracked members.
+
+    Writes may wait up to busy_timeout for other workers' write lock, so
+    callers run them in a thread (``blocking``). The lock keeps a single
+    write from landing inside another thread's transaction.
+    """
+
+    blocking = True
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA busy_timeout=5000")
+        self.db.executescript(SCHEMA)
+
+    def get_xp(self, guild_id, user_id):
+        row = self.db.execute(
+            "SELECT xp FROM xp WHERE guild_id = ? AND user_id = ?",
+            (guild_id, user_id)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def add_xp(self, guild_id, user_id, amount):
+        row = self.db.execute(
+            "INSERT INTO xp (guild_id, user_id, xp) VALUES (?, ?, ?) "
+            "ON CONFLICT (guild_id, user_id) DO UPDATE SET xp = xp + excluded.xp "
+            "RETURNING xp",
+            (guild_id, user_id, amount)
+        ).fetchone()
+        return row[0]
+
+    def all_xp(self, guild_id):
+        return self.db.execute(
+            "SELECT user_id, xp FROM xp WHERE guild_id = ?",
+            (guild_id,)
+        ).fetchall()
+
+    def get_level(self, guild_id, user_id):
+        row = self.db.execute(
+            "SELECT level FROM xp WHERE guild_id = ? AND user_id = ?",
+            (guild_id, user_id)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set_level(self, guild_id, user_id, level):
+        self.db.execute(
+            "INSERT INTO xp (guild_id, user_id, level) VALUES (?, ?, ?) "
+            "ON CONFLICT (guild_id, user_id) DO UPDATE SET level = excluded.level",
+            (guild_id, user_id, level)
+        )
+
+    def add_warning(self, guild_id, user_id, reason, ts=None):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO warnings (guild_id, user_id, reason, time) VALUES (?, ?, ?, ?)",
+                (guild_id, user_id, reason, int(ts or time.time()))
+            )
+            return self.warning_count(guild_id, user_id)
+
+    def warning_count(self, guild_id, user_id):
+        return self.db.execute(
+            "SELECT COUNT(*) FROM warnings WHERE guild_id = ? AND user_id = ?",
+            (guild_id, user_id)
+        ).fetchone()[0]
+
+    def clear_warnings(self, guild_id, user_id):
+        with self.lock:
+            cur = self.db.execute(
+                "DELETE FROM warnings WHERE guild_id = ? AND user_id = ?",
+                (guild_id, user_id)
+            )
+            return cur.rowcount > 0
+
+    @contextmanager
+    def transaction(self):
+        # IMMEDIATE takes the write lock up front, so sharded workers sharing
+        # the file queue on busy_timeout instead of failing mid-transaction
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            yield
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def open_storage(kind, guilds, db_path):
+    if kind == "sqlite":
+        return SqliteStorage(db_path)
+    if kind == "json":
+        return JsonStorage(guilds)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+# ======================
+# MIGRATOR (state.json -> SQLite)
+# ======================
+def legacy_data(state):
+    """(users, warnings) still in the single-server stats/GLOBAL sections of state.json."""
+    stats = state.get("stats", {})
+    users = set(stats.get("messages", {})) | set(stats.get("levels", {}))
+    warnings = state.get("servers", {}).get("GLOBAL", {}).get("warnings", {})
+    return len(users), sum(map(len, warnings.values()))
+
+
+def migrate_state(state, db, guild_id):
+    """
+    Copy the GLOBAL stats/warnings of a state.json document into db. Returns
+    row counts. Safe to run again: warnings already there are not added twice.
+    """
+    stats = state.get("stats", {})
+    xp = stats.get("messages", {})
+    levels = stats.get("levels", {})
+    warnings = state.get("servers", {}).get("GLOBAL", {}).get("warnings", {})
+
+    users = set(xp) | set(levels)
+    xp_rows = [
+        (guild_id, int(uid), xp.get(uid, 0), levels.get(uid, 0))
+        for uid in users
+    ]
+    warn_rows = [
+        (guild_id, int(uid), w.get("reason", ""), w.get("time", 0))
+        for uid, warns in warnings.items()
+        for w in warns
+    ]
+
+    with db.transaction():
+        db.db.executemany(
+            "INSERT INTO xp (guild_id, user_id, xp, level) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (guild_id, user_id) DO UPDATE SET "
+            "xp = excluded.xp, level = excluded.level",
+            xp_rows
+        )
+        db.db.executemany(
+            "INSERT INTO warnings (guild_id, user_id, reason, time) SELECT ?1, ?2, ?3, ?4 "
+            "WHERE NOT EXISTS (SELECT 1 FROM warnings WHERE guild_id = ?1 AND user_id = ?2 "
+            "AND reason = ?3 AND time = ?4)",
+            warn_rows
+        )
+    return len(xp_rows), len(warn_rows)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Migrate state.json XP/levels/warnings into SQLite")
+    p.add_argument("state", nargs="?", default="state.json")
+    p.add_argument("db", nargs="?", default=os.getenv("DB_PATH", "cattrix.db"))
+    p.add_argument("--guild", type=int, required=True,
+                   help="guild id to file the legacy GLOBAL data under")
+    p.add_argument("--prune", action="store_true",
+                   help="empty the migrated sections in state.json afterwards")
+    args = p.parse_args()
+
+    with open(args.state, "r") as f:
+        state = json.load(f)
+
+    db = SqliteStorage(args.db)
+    users, warns = migrate_state(state, db, args.guild)
+    db.close()
+    print(f"Migrated {users} users and {warns} warnings into {args.db}")
+
+    if args.prune:
+        state.setdefault("stats", {}).update({"messages": {}, "levels": {}})
+        state.setdefault("servers", {}).setdefault("GLOBAL", {})["warnings"] = {}
+        atomic_write(args.state, json.dumps(state, indent=2))
+        print(f"Pruned migrated sections from {args.state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os, sys, asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_pipeline import AIRefused, ResponseCache
+
+
+def run(*coros):
+    async def main():
+        return await asyncio.gather(*coros, return_exceptions=True)
+    return asyncio.run(main())
+
+
+def slow(value, calls):
+    async def fetch():
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        if isinstance(value, Exception):
+            raise value
+        return value
+    return fetch
+
+
+def test_same_lane_shares_one_fetch():
+    cache, calls = ResponseCache(), []
+    a, b = run(cache.get_or_fetch("k", slow("x", calls)), cache.get_or_fetch("k", slow("y", calls)))
+    assert (a, b) == ("x", "x")
+    assert calls == ["x"]
+    assert cache.coalesced == 1
+
+
+def test_lanes_do_not_share():
+    cache, calls = ResponseCache(), []
+    a, b = run(cache.get_or_fetch("k", slow("chat", calls), lane=1),
+               cache.get_or_fetch("k", slow("command", calls), lane=0))
+    assert (a, b) == ("chat", "command")
+    assert calls == ["chat", "command"]
+
+
+def test_refusal_is_not_handed_on():
+    cache, calls = ResponseCache(), []
+    a, b = run(cache.get_or_fetch("k", slow(AIRefused("rate_limited", 5), calls), refetch_on=(AIRefused,)),
+               cache.get_or_fetch("k", slow("mine", calls), refetch_on=(AIRefused,)))
+    assert isinstance(a, AIRefused)
+    assert b == "mine"
+    assert cache.get("k") == "mine"
+
+
+def test_join_check_can_refuse():
+    cache, calls = ResponseCache(), []
+
+    def limited():
+        raise AIRefused("rate_limited", 1)
+
+    a, b = run(cache.get_or_fetch("k", slow("x", calls)),
+               cache.get_or_fetch("k", slow("y", calls), on_join=limited))
+    assert a == "x"
+    assert isinstance(b, AIRefused) and b.reason == "rate_limited"
+    assert calls == ["x"]
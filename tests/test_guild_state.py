@@ -0,0 +1,29 @@
+import os, sys, json, asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import guild_state
+from guild_state import GuildStore
+
+
+def test_failed_write_keeps_the_rest_of_the_batch(tmp_path, monkeypatch):
+    guilds = GuildStore(str(tmp_path), idle_timeout=0)
+    for gid in (1, 2, 3):
+        guilds.get(gid)["stats"]["messages"]["7"] = gid
+        guilds.mark_dirty(gid)
+
+    write = guild_state.atomic_write
+    def flaky(path, text):
+        if path.endswith("1.json"):
+            raise OSError("disk full")
+        write(path, text)
+    monkeypatch.setattr(guild_state, "atomic_write", flaky)
+
+    asyncio.run(guilds.aflush())
+    assert guilds.dirty == {1}
+    for gid in (2, 3):
+        with open(tmp_path / f"{gid}.json") as f:
+            assert json.load(f)["stats"]["messages"] == {"7": gid}
+
+    # Only the written guilds may be dropped from memory
+    guilds.evict_idle()
+    assert list(guilds.guilds) == [1]
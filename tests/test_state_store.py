@@ -0,0 +1,150 @@
+import os, sys, json, asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state_store import StateStore, VersionConflict, dashboard_update
+
+
+@pytest.fixture
+def path(tmp_path):
+    p = tmp_path / "state.json"
+    p.write_text(json.dumps({"bot": {"ticks": 0}, "level": {"enabled": False}, "welcome": {}}))
+    return str(p)
+
+
+def read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# ======================
+# MERGE / DIRTY SECTIONS
+# ======================
+def test_flush_writes_only_dirty_sections(path):
+    store = StateStore(path)
+    store["bot"]["ticks"] = 1
+    store["level"]["enabled"] = True  # changed but never marked dirty
+    store.mark_dirty("bot")
+
+    assert store.flush()
+    disk = read(path)
+    assert disk["bot"] == {"ticks": 1}
+    assert disk["level"] == {"enabled": False}
+    assert not store.dirty
+
+
+def test_dashboard_edit_during_flush_survives(path):
+    store = StateStore(path)
+    store["bot"]["ticks"] = 1
+    store.mark_dirty("bot")
+
+    # The dashboard writes after the bot took its snapshot, before its commit
+    commit = store._commit
+    def racing_commit(sections):
+        dashboard_update(path, {"level": {"enabled": True}})
+        return commit(sections)
+    store._commit = racing_commit
+
+    asyncio.run(store.aflush())
+    disk = read(path)
+    assert disk["bot"] == {"ticks": 1}
+    assert disk["level"] == {"enabled": True}
+    assert store["level"] == {"enabled": True}
+
+
+def test_change_during_flush_stays_live(path):
+    store = StateStore(path)
+    ticks = store["bot"]
+    store.mark_dirty("bot")
+
+    async def run():
+        flush = asyncio.create_task(store.aflush())
+        await asyncio.sleep(0)  # snapshot taken, write in flight
+        ticks["ticks"] = 9
+        await flush
+
+    asyncio.run(run())
+    assert store["bot"] is ticks
+    assert store["bot"] == {"ticks": 9}
+
+
+def test_sync_keeps_unsaved_sections(path):
+    store = StateStore(path)
+    store["level"]["enabled"] = "bot"
+    store.mark_dirty("level")
+    dashboard_update(path, {"level": {"enabled": "dashboard"}, "welcome": {"enabled": True}})
+
+    assert store.sync_external()
+    assert store["level"] == {"enabled": "bot"}
+    assert store["welcome"] == {"enabled": True}
+
+
+def test_sync_runs_watchers_for_changed_sections(path):
+    store = StateStore(path)
+    seen = []
+    store.on_change("welcome", seen.append)
+    store.on_change("bot", seen.append)
+    dashboard_update(path, {"welcome": {"enabled": True}})
+
+    store.sync_external()
+    assert seen == [{"enabled": True}]
+
+
+def test_failed_flush_marks_sections_dirty_again(path):
+    store = StateStore(path)
+    store["bot"]["ticks"] = 5
+    store.mark_dirty("bot")
+
+    def broken(sections):
+        raise OSError("disk full")
+    store._commit = broken
+    with pytest.raises(OSError):
+        asyncio.run(store.aflush())
+    assert store.dirty == {"bot"}
+
+    del store._commit
+    assert store.flush()
+    assert read(path)["bot"] == {"ticks": 5}
+
+
+# ======================
+# SECTION VERSIONS
+# ======================
+def test_bot_flush_does_not_move_versions(path):
+    dashboard_update(path, {"level": {"enabled": True}})
+    store = StateStore(path)
+    store["bot"]["ticks"] = 1
+    store.mark_dirty("bot")
+    store.flush()
+
+    assert read(path)["_versions"] == {"level": 1}
+    # A dashboard holding the pre-flush versions still saves
+    dashboard_update(path, {"level": {"enabled": False}, "_versions": {"level": 1}})
+    assert read(path)["_versions"] == {"level": 2}
+
+
+def test_stale_version_conflicts(path):
+    dashboard_update(path, {"level": {"enabled": True}})
+    with pytest.raises(VersionConflict) as e:
+        dashboard_update(path, {"level": {"enabled": False}, "_versions": {"level": 0}})
+    assert e.value.versions == {"level": 1}
+    assert read(path)["level"] == {"enabled": True}
+
+
+def test_versions_are_per_section(path):
+    dashboard_update(path, {"level": {"enabled": True}})
+    dashboard_update(path, {"welcome": {"enabled": True}, "_versions": {"welcome": 0}})
+    assert read(path)["_versions"] == {"level": 1, "welcome": 1}
+
+
+def test_legacy_document_version_is_dropped(path):
+    data = read(path)
+    data["_version"] = 7
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+    dashboard_update(path, {"level": {"enabled": True}})
+    disk = read(path)
+    assert "_version" not in disk
+    assert disk["_versions"] == {"level": 1}
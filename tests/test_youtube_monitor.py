@@ -0,0 +1,158 @@
+import os, sys, json, shutil, asyncio
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("dotenv")
+import discord
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHANNEL = "UC0000000000000000000000"
+OPTS = {"videos": True, "shorts": True, "live": True}
+
+
+def video(vid):
+    return {"id": vid, "snippet": {"title": vid, "liveBroadcastContent": "none"},
+            "contentDetails": {"duration": "PT4M"}}
+
+
+class FakeYouTube:
+    """Uploads list per channel with an ETag, answering 304 (None) when it matches."""
+
+    def __init__(self):
+        self.lists = {}
+        self.lookups = 0
+
+    async def get_recent_uploads(self, channel_id, limit=5, etag=None):
+        ids, tag = self.lists[channel_id]
+        return None if etag == tag else (ids, tag)
+
+    async def get_videos(self, video_ids):
+        self.lookups += 1
+        return {v: video(v) for v in video_ids}
+
+
+class FakeResponse:
+    status = 503
+    reason = "Service Unavailable"
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+        self.fail = False
+        self.during_send = None
+
+    async def send(self, embed=None, **kwargs):
+        if self.during_send:
+            await self.during_send()
+        if self.fail:
+            raise discord.HTTPException(FakeResponse(), "down")
+        self.sent.append(embed.description)
+
+
+@pytest.fixture(scope="module")
+def cattrix(tmp_path_factory):
+    """catTrix imported in a scratch directory, as bench/loadtest.py does."""
+    workdir = tmp_path_factory.mktemp("cattrix")
+    with open(os.path.join(ROOT, "state.json")) as f:
+        state = json.load(f)
+    state["servers"]["GLOBAL"]["moderation"]["log_channel_id"] = 1
+    with open(workdir / "state.json", "w") as f:
+        json.dump(state, f)
+    shutil.copytree(os.path.join(ROOT, "assets"), workdir / "assets")
+
+    os.environ.update(DISCORD_TOKEN="test", YOUTUBE_API_KEY="test", STORAGE_BACKEND="json",
+                      GUILDS_DIR=str(workdir / "guilds"), DB_PATH=str(workdir / "cattrix.db"))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import catTrix
+        yield catTrix
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def monitor(cattrix):
+    store = cattrix.store
+    store.data["yt_channels"] = {CHANNEL: OPTS}
+    store.data.pop("yt_seen", None)
+    store.dirty.clear()
+
+    channel = FakeChannel()
+    cattrix.bot.get_channel = lambda channel_id: channel
+    monitor = cattrix.YouTubeMonitor(cattrix.bot, FakeYouTube())
+    monitor.channel = channel
+    return monitor
+
+
+def seen(cattrix):
+    return cattrix.store.data["yt_seen"][CHANNEL]
+
+
+def test_first_check_records_without_posting(cattrix, monitor):
+    monitor.yt.lists[CHANNEL] = (["v2", "v1"], "e1")
+    asyncio.run(monitor.check_channels())
+
+    assert monitor.channel.sent == []
+    assert seen(cattrix)["ids"] == ["v2", "v1"]
+    assert seen(cattrix)["etag"] == "e1"
+    assert "yt_seen" in cattrix.store.dirty
+
+
+def test_unchanged_list_is_not_looked_up(cattrix, monitor):
+    monitor.yt.lists[CHANNEL] = (["v1"], "e1")
+    asyncio.run(monitor.check_channels())
+    asyncio.run(monitor.check_channels())
+
+    assert monitor.yt.lookups == 1
+    assert monitor.channel.sent == []
+
+
+def test_new_upload_is_posted_once(cattrix, monitor):
+    monitor.yt.lists[CHANNEL] = (["v1"], "e1")
+    asyncio.run(monitor.check_channels())
+    monitor.yt.lists[CHANNEL] = (["v3", "v2", "v1"], "e2")
+    asyncio.run(monitor.check_channels())
+    asyncio.run(monitor.check_channels())
+
+    assert [text.split("\n")[1] for text in monitor.channel.sent] == ["**v2**", "**v3**"]
+    assert seen(cattrix)["ids"] == ["v3", "v2", "v1"]
+    assert seen(cattrix)["etag"] == "e2"
+
+
+def test_failed_send_is_retried(cattrix, monitor):
+    monitor.yt.lists[CHANNEL] = (["v1"], "e1")
+    asyncio.run(monitor.check_channels())
+    monitor.yt.lists[CHANNEL] = (["v2", "v1"], "e2")
+
+    monitor.channel.fail = True
+    asyncio.run(monitor.check_channels())
+    assert seen(cattrix)["ids"] == ["v1"]
+    assert seen(cattrix)["etag"] == "e1"
+
+    monitor.channel.fail = False
+    asyncio.run(monitor.check_channels())
+    assert len(monitor.channel.sent) == 1
+    assert seen(cattrix)["ids"] == ["v2", "v1"]
+
+
+def test_flush_during_announcement_keeps_posted_ids(cattrix, monitor):
+    store = cattrix.store
+    monitor.yt.lists[CHANNEL] = (["v1"], "e1")
+    asyncio.run(monitor.check_channels())
+    monitor.yt.lists[CHANNEL] = (["v2", "v1"], "e2")
+
+    async def poll():
+        monitor.channel.during_send = store.aflush
+        await monitor.check_channels()
+        await store.aflush()
+
+    asyncio.run(poll())
+    with open(store.path) as f:
+        disk = json.load(f)["yt_seen"][CHANNEL]
+    assert disk["ids"] == ["v2", "v1"]
+    assert disk["etag"] == "e2"
@@ -1,17 +1,33 @@
-from flask import Flask, render_template, request, jsonify
-import json, os
+from flask import Flask, Response, render_template, request, jsonify
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state_store import StateReader, VersionConflict, dashboard_update, notify_change
 
 STATE_FILE = "state.json"
 
 app = Flask(__name__)
-
-def load_state():
-    with open(STATE_FILE, "r") as f:
-        return json.load(f)
-
-def save_state(data):
-    with open(STATE_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+reader = StateReader(STATE_FILE)
+
+def state_response(section=None):
+    """Cached JSON body with ETag/304 and gzip when the client accepts it."""
+    entry = reader.encoded(section)
+    if entry is None:
+        return jsonify({"error": f"unknown section: {section}"}), 404
+
+    etag, body, _ = entry
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        gz = reader.gzipped(entry) if "gzip" in request.accept_encodings else None
+        resp = Response(gz or body, mimetype="application/json")
+        if gz:
+            resp.headers["Content-Encoding"] = "gzip"
+
+    resp.set_etag(etag)
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
 
 @app.route("/")
 def index():
@@ -19,18 +35,22 @@ def index():
 
 @app.route("/api/state")
 def state():
-    return jsonify(load_state())
+    return state_response()
+
+@app.route("/api/state/<section>")
+def state_section(section):
+    return state_response(section)
 
 @app.route("/api/update", methods=["POST"])
 def update():
-    state = load_state()
-    payload = request.json
-
-    for key, value in payload.items():
-        state[key] = value
-
-    save_state(state)
-    return {"ok": True}
+    """Deep-merge the payload. Send "_versions" to only apply it on top of those section versions."""
+    try:
+        state = dashboard_update(STATE_FILE, request.json)
+    except VersionConflict as e:
+        return jsonify({"ok": False, "error": "conflict", "_versions": e.versions}), 409
+
+    notify_change(STATE_FILE)
+    return {"ok": True, "_versions": state["_versions"]}
 
 if __name__ == "__main__":
     app.run(
@@ -1,9 +1,30 @@
+// Per-section versions: a save only conflicts with edits to the same sections
+let versions = null;
+
+async function loadVersions() {
+  const r = await fetch("/api/state/_versions");
+  versions = r.ok ? await r.json() : {};
+}
+
 async function update(data) {
-  await fetch("/api/update", {
+  if (versions === null) await loadVersions();
+
+  const expected = {};
+  for (const key of Object.keys(data)) expected[key] = versions[key] || 0;
+
+  const r = await fetch("/api/update", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(data)
+    body: JSON.stringify({ ...data, _versions: expected })
   });
+  const res = await r.json();
+  versions = res._versions || versions;
+
+  if (r.status === 409) {
+    alert("Settings were changed elsewhere, nothing was saved. Check and save again.");
+    return false;
+  }
+  return true;
 }
 
 function show(section) {
@@ -43,43 +64,43 @@ function show(section) {
   }
 }
 
-function saveWelcome() {
-  update({
+async function saveWelcome() {
+  const ok = await update({
     welcome: {
       enabled: true,
       channel_id: document.getElementById("w_ch").value,
       message: document.getElementById("w_msg").value
     }
   });
-  alert("Welcome updated");
+  if (ok) alert("Welcome updated");
 }
 
-function saveLevel() {
-  update({
+async function saveLevel() {
+  const ok = await update({
     level: {
       enabled: true,
       channel_id: document.getElementById("l_ch").value
     }
   });
-  alert("Level updated");
+  if (ok) alert("Level updated");
 }
 
-function addYT() {
+async function addYT() {
   const id = document.getElementById("yt_ch").value;
-  update({
+  const ok = await update({
     yt_channels: {
       [id]: { live: true, videos: true, shorts: true }
     }
   });
-  alert("YouTube channel added");
+  if (ok) alert("YouTube channel added");
 }
 
-function joinLive() {
+async function joinLive() {
   const vid = document.getElementById("live_id").value;
-  update({
+  const ok = await update({
     streams: {
       [vid]: { force_join: true }
     }
   });
-  alert("Bot will join live chat");
+  if (ok) alert("Bot will join live chat");
 }
\ No newline at end of file
@@ -0,0 +1,116 @@
+import os, json, asyncio, hashlib, logging
+
+from aiohttp import web
+
+from metrics import metrics
+from state_store import VersionConflict, dashboard_update, notify_change
+
+log = logging.getLogger("CatTrix.dashboard")
+
+WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web")
+
+
+async def metrics_handler(request):
+    return web.Response(text=metrics.render(), content_type="text/plain",
+                        headers={"X-Prometheus-Format": "0.0.4"})
+
+
+# ======================
+# IN-LOOP DASHBOARD (aiohttp)
+# ======================
+class AsyncDashboard:
+    """
+    The web/app.py API served from the bot's own event loop. Reads come
+    straight from the live StateStore; updates go through the same locked
+    update_state() as the Flask dashboard and are synced back immediately.
+    Each section's body and ETag are cached until the store's revision for
+    it moves.
+    """
+
+    def __init__(self, store, host="0.0.0.0", port=5000):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.runner = None
+        self._encoded = {}  # section (None = whole document) -> (revision, etag, body)
+
+        self.app = web.Application()
+        self.app.router.add_get("/", self.index)
+        self.app.router.add_get("/api/state", self.state)
+        self.app.router.add_get("/api/state/{section}", self.state)
+        self.app.router.add_post("/api/update", self.update)
+        self.app.router.add_get("/metrics", metrics_handler)
+        self.app.router.add_static("/static", os.path.join(WEB_DIR, "static"))
+
+    async def index(self, request):
+        return web.FileResponse(os.path.join(WEB_DIR, "templates", "index.html"))
+
+    async def state(self, request):
+        section = request.match_info.get("section")
+        data = self.store.data
+        if section is not None and section not in data:
+            return web.json_response({"error": f"unknown section: {section}"}, status=404)
+
+        etag, body = self._encode(section)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if etag in request.headers.get("If-None-Match", "").replace('"', "").split(", "):
+            return web.Response(status=304, headers=headers)
+
+        resp = web.Response(body=body, content_type="application/json", headers=headers)
+        if len(body) >= 1024:
+            resp.enable_compression()
+        return resp
+
+    def _encode(self, section):
+        store = self.store
+        revision = store.revision if section is None else store.revisions.get(section, 0)
+        cached = self._encoded.get(section)
+        if cached is None or cached[0] != revision:
+            data = store.data if section is None else store.data[section]
+            body = json.dumps(data).encode()
+            etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+            cached = self._encoded[section] = (revision, etag, body)
+        return cached[1], cached[2]
+
+    async def update(self, request):
+        payload = await request.json()
+        path = self.store.path
+
+        try:
+            state = await asyncio.to_thread(dashboard_update, path, payload)
+        except VersionConflict as e:
+            return web.json_response({"ok": False, "error": "conflict", "_versions": e.versions}, status=409)
+
+        self.store.sync_external()
+        await asyncio.to_thread(notify_change, path)
+        return web.json_response({"ok": True, "_versions": state["_versions"]})
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        log.info(f"Dashboard on http://{self.host}:{self.port}")
+
+    async def close(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+# ======================
+# METRICS ONLY
+# ======================
+class MetricsServer:
+    """Just /metrics, for workers that don't serve the dashboard (Flask, or not primary)."""
+
+    def __init__(self, host="0.0.0.0", port=9100):
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", metrics_handler)
+        self.runner = None
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        log.info(f"Metrics on http://{self.host}:{self.port}/metrics")
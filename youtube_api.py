@@ -0,0 +1,352 @@
+import re, time, asyncio, logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from metrics import metrics
+
+log = logging.getLogger("CatTrix.youtube")
+
+API_URL = "https://www.googleapis.com/youtube/v3"
+
+# Data API quota units per call (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COST = {
+    ("GET", "/search"): 100,
+    ("GET", "/videos"): 1,
+    ("GET", "/channels"): 1,
+    ("GET", "/playlistItems"): 1,
+    ("GET", "/liveChat/messages"): 5,
+    ("POST", "/liveChat/messages"): 50,
+}
+
+# Endpoints channel checks spend their reserved budget on
+POLL_ENDPOINTS = ("/playlistItems", "/videos", "/channels")
+
+QUOTA_REASONS = ("quotaExceeded", "dailyLimitExceeded")
+CHAT_ENDED_REASONS = ("liveChatEnded", "liveChatNotFound", "liveChatDisabled", "forbidden")
+
+_DURATION = re.compile(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?")
+
+
+def parse_duration(text):
+    """ISO 8601 video duration ('PT1M5S') in seconds; 0 when missing or live ('P0D')."""
+    m = _DURATION.fullmatch(text or "")
+    if not m:
+        return 0
+    d, h, mins, sec = (int(g or 0) for g in m.groups())
+    return ((d * 24 + h) * 60 + mins) * 60 + sec
+
+
+# Quota resets at midnight Pacific; a fixed UTC-8 is close enough for budgeting
+PACIFIC = timezone(timedelta(hours=-8))
+
+
+class YouTubeAPIError(Exception):
+    def __init__(self, status, reason, message=""):
+        super().__init__(f"{status} {reason}: {message}")
+        self.status = status
+        self.reason = reason
+
+    @property
+    def quota(self):
+        return self.status == 403 and self.reason in QUOTA_REASONS
+
+
+# ======================
+# QUOTA TRACKER
+# ======================
+class QuotaTracker:
+    """Units spent per endpoint for the current quota day."""
+
+    def __init__(self, daily_limit=10000, reserved=0):
+        self.daily_limit = daily_limit
+        self.reserved = reserved  # units kept for channel checks (the PollScheduler budget)
+        self.chats = 0            # LiveChat pollers currently sharing what is left
+        self.day = None
+        self.spent = {}
+        self.blocked_until = 0
+        self._roll()
+
+    def _roll(self):
+        day = datetime.now(PACIFIC).date().isoformat()
+        if day != self.day:
+            self.day = day
+            self.spent = {}
+
+    @staticmethod
+    def next_reset():
+        now = datetime.now(PACIFIC)
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight.timestamp()
+
+    def charge(self, endpoint, units):
+        self._roll()
+        self.spent[endpoint] = self.spent.get(endpoint, 0) + units
+
+    @property
+    def used(self):
+        self._roll()
+        return sum(self.spent.values())
+
+    @property
+    def remaining(self):
+        return max(self.daily_limit - self.used, 0)
+
+    def block_until_reset(self):
+        self.blocked_until = self.next_reset()
+        log.warning("YouTube quota exhausted, pausing until the daily reset")
+
+    def exhausted(self):
+        return time.time() < self.blocked_until or self.remaining <= 0
+
+    @property
+    def free(self):
+        """Units left today beyond what channel checks still have reserved."""
+        remaining = self.remaining
+        polled = sum(self.spent.get(endpoint, 0) for endpoint in POLL_ENDPOINTS)
+        return max(remaining - max(self.reserved - polled, 0), 0)
+
+    def spacing(self, units, share=1):
+        """
+        Seconds between calls costing `units`, so that `share` callers doing
+        the same make the free budget last until the reset.
+        """
+        left = self.next_reset() - time.time()
+        return min(left, left * units * share / max(self.free, 1))
+
+    def to_dict(self):
+        return {"day": self.day, "spent": self.spent, "blocked_until": self.blocked_until}
+
+    def load(self, d):
+        if d and d.get("day") == datetime.now(PACIFIC).date().isoformat():
+            self.day = d["day"]
+            self.spent = dict(d.get("spent", {}))
+            self.blocked_until = d.get("blocked_until", 0)
+
+
+# ======================
+# ASYNC DATA API CLIENT
+# ======================
+class AsyncYouTube:
+    """
+    Minimal YouTube Data API v3 client on a pooled httpx.AsyncClient.
+
+    Authenticate with either an API key or `token`, an async callable
+    returning a fresh OAuth access token (needed for live chat writes).
+    """
+
+    def __init__(self, api_key=None, token=None, base_url=API_URL,
+                 max_connections=10, timeout=15, quota=None):
+        import httpx  # deferred: startup shouldn't pay for it when YouTube is unused
+
+        self.api_key = api_key
+        self.token = token
+        self.quota = quota
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    async def request(self, method, path, params, body=None, etag=None):
+        """Returns the JSON body, or None when `etag` still matches (304)."""
+        params = {k: v for k, v in params.items() if v is not None}
+        headers = {"If-None-Match": etag} if etag else {}
+        if self.token:
+            headers["Authorization"] = f"Bearer {await self.token()}"
+        elif self.api_key:
+            params["key"] = self.api_key
+
+        with metrics.timer("cattrix_youtube_request_seconds", endpoint=path):
+            r = await self.client.request(method, path, params=params, json=body, headers=headers)
+        if r.status_code >= 400:
+            try:
+                err = r.json()["error"]
+                reason = err["errors"][0]["reason"]
+                message = err.get("message", "")
+            except (ValueError, KeyError, IndexError):
+                reason, message = "httpError", r.text[:200]
+            error = YouTubeAPIError(r.status_code, reason, message)
+            metrics.counter("cattrix_youtube_errors_total", reason=reason).inc()
+            if self.quota and error.quota:
+                self.quota.block_until_reset()
+            raise error
+
+        if self.quota:
+            self.quota.charge(path, QUOTA_COST.get((method, path), 1))
+        if r.status_code == 304:
+            return None
+        return r.json()
+
+    async def search(self, **params):
+        return await self.request("GET", "/search", params)
+
+    async def videos(self, **params):
+        return await self.request("GET", "/videos", params)
+
+    async def videos_batch(self, ids, part):
+        """videos.list for any number of IDs, 50 per call (1 unit each)."""
+        ids = list(dict.fromkeys(ids))
+        items = []
+        for i in range(0, len(ids), 50):
+            res = await self.videos(part=part, id=",".join(ids[i:i + 50]))
+            items += res.get("items", [])
+        return items
+
+    async def channels(self, **params):
+        return await self.request("GET", "/channels", params)
+
+    async def playlist_items(self, etag=None, **params):
+        return await self.request("GET", "/playlistItems", params, etag=etag)
+
+    async def live_chat_messages(self, **params):
+        return await self.request("GET", "/liveChat/messages", params)
+
+    async def insert_live_chat_message(self, chat_id, text):
+        return await self.request(
+            "POST", "/liveChat/messages", {"part": "snippet"},
+            body={
+                "snippet": {
+                    "liveChatId": chat_id,
+                    "type": "textMessageEvent",
+                    "textMessageDetails": {"messageText": text}
+                }
+            }
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# ======================
+# LIVE CHAT ENGINE
+# ======================
+@dataclass
+class ChatEvent:
+    id: str
+    author: str
+    text: str
+    published: str
+    raw: dict
+
+
+class LiveChat:
+    """
+    Follows one broadcast's live chat: waits pollingIntervalMillis between
+    pages, continues from nextPageToken, drops already-seen message IDs and
+    fans events out to every `subscribe()` iterator until the chat ends.
+
+    The Data API only offers paged polling to API-key clients, so this is the
+    cheapest way to read chat: one call per interval, never a page twice.
+    Polling stops when the quota is exhausted and slows down as it runs low;
+    the budget left after channel checks is shared by all running chats.
+    """
+
+    def __init__(self, youtube, video_id, chat_id=None, min_interval=1.0,
+                 skip_backlog=True, seen_limit=5000):
+        self.youtube = youtube
+        self.video_id = video_id
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.skip_backlog = skip_backlog
+        self.seen_limit = seen_limit
+        self.seen = OrderedDict()
+        self.subscribers = []
+
+    async def resolve_chat_id(self):
+        if not self.chat_id:
+            res = await self.youtube.videos(part="liveStreamingDetails", id=self.video_id)
+            items = res.get("items", [])
+            if items:
+                self.chat_id = items[0].get("liveStreamingDetails", {}).get("activeLiveChatId")
+        return self.chat_id
+
+    def subscribe(self, maxsize=1000):
+        q = asyncio.Queue(maxsize)
+        self.subscribers.append(q)
+        return self._drain(q)
+
+    async def _drain(self, q):
+        while True:
+            event = await q.get()
+            if event is None:
+                return
+            yield event
+
+    def _publish(self, event):
+        for q in self.subscribers:
+            if q.full():
+                q.get_nowait()  # slow consumer: drop its oldest event
+            q.put_nowait(event)
+
+    def _is_new(self, mid):
+        if mid in self.seen:
+            return False
+        self.seen[mid] = None
+        if len(self.seen) > self.seen_limit:
+            self.seen.popitem(last=False)
+        return True
+
+    async def run(self):
+        """
+        Poll until the chat ends, then close every subscriber. Returns True
+        when the API reported the chat ended, False when polling stopped
+        without that (no chat found, quota used up).
+        """
+        quota = self.youtube.quota
+        cost = QUOTA_COST[("GET", "/liveChat/messages")]
+        if quota:
+            quota.chats += 1
+        try:
+            if not await self.resolve_chat_id():
+                return False
+
+            page = None
+            first = True
+            while True:
+                if quota and (quota.exhausted() or quota.free < cost):
+                    log.warning(f"YouTube quota used up, stopped reading chat of {self.video_id}")
+                    return False
+                try:
+                    res = await self.youtube.live_chat_messages(
+                        liveChatId=self.chat_id,
+                        part="snippet,authorDetails",
+                        pageToken=page,
+                        maxResults=2000
+                    )
+                except YouTubeAPIError as e:
+                    if e.status == 404 or e.reason in CHAT_ENDED_REASONS:
+                        return True
+                    raise
+
+                for item in res.get("items", []):
+                    if not self._is_new(item["id"]) or (first and self.skip_backlog):
+                        continue
+                    self._publish(ChatEvent(
+                        id=item["id"],
+                        author=item["authorDetails"]["displayName"],
+                        text=item["snippet"].get("displayMessage", ""),
+                        published=item["snippet"].get("publishedAt", ""),
+                        raw=item
+                    ))
+
+                if res.get("offlineAt"):
+                    return True
+
+                first = False
+                page = res.get("nextPageToken", page)
+                wait = res.get("pollingIntervalMillis", 5000) / 1000
+                if quota:
+                    # Spread polls so the day's free budget holds out for every chat
+                    wait = max(wait, quota.spacing(cost, quota.chats))
+                await asyncio.sleep(max(wait, self.min_interval))
+        finally:
+            if quota:
+                quota.chats -= 1
+            for q in self.subscribers:
+                if q.full():
+                    q.get_nowait()
+                q.put_nowait(None)
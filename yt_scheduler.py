@@ -0,0 +1,105 @@
+import time, random, logging
+
+log = logging.getLogger("CatTrix.youtube")
+
+
+# ======================
+# POLL SCHEDULER
+# ======================
+class PollScheduler:
+    """
+    Decides when each YouTube channel is checked next.
+
+    `daily_budget` quota units per day are split evenly across channels and
+    each check costs `check_cost` units, which gives a base interval. That
+    interval is then reshaped by hour of day: hours in which a channel has
+    gone live before get proportionally more checks and quiet hours fewer,
+    keeping the daily total the same. Errors back off exponentially; quota
+    errors pause everything until the quota tracker resets.
+    """
+
+    def __init__(self, quota, daily_budget, check_cost=2,
+                 min_interval=60, max_interval=3600):
+        self.quota = quota
+        self.daily_budget = daily_budget
+        self.check_cost = check_cost
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.next_due = {}     # channel_id -> time.time() of next check
+        self.failures = {}     # channel_id -> consecutive errors
+        self.live_hours = {}   # channel_id -> [24 counts of live starts per UTC hour]
+
+    def _weight(self, cid, hour):
+        hist = self.live_hours.get(cid)
+        if not hist:
+            return 1.0
+        # Count the hour before a usual start too, so we catch it going live
+        return 1.0 + hist[hour] + hist[(hour + 1) % 24]
+
+    def interval(self, cid, n_channels, hour=None):
+        hour = time.gmtime().tm_hour if hour is None else hour
+        checks = max(self.daily_budget / max(n_channels, 1) / self.check_cost, 1)
+        base = 86400 / checks
+
+        mean = sum(self._weight(cid, h) for h in range(24)) / 24
+        iv = base * mean / self._weight(cid, hour)
+        return min(max(iv, self.min_interval), self.max_interval)
+
+    def due(self, channel_ids):
+        if self.quota.exhausted():
+            return []
+
+        now = time.time()
+        due = []
+        for cid in channel_ids:
+            if cid not in self.next_due:
+                # Spread first checks so a restart doesn't burst every channel
+                self.next_due[cid] = now + random.uniform(0, self.min_interval)
+            if self.next_due[cid] <= now:
+                due.append(cid)
+        return due
+
+    def add(self, channel_ids):
+        """Channels added while running are checked right away instead of spread out."""
+        now = time.time()
+        for cid in channel_ids:
+            self.next_due.setdefault(cid, now)
+
+    def done(self, cid, n_channels):
+        self.failures.pop(cid, None)
+        self.next_due[cid] = time.time() + self.interval(cid, n_channels)
+
+    def failed(self, cid, error, n_channels):
+        if getattr(error, "quota", False):
+            self.next_due[cid] = self.quota.blocked_until
+            return
+
+        n = self.failures[cid] = self.failures.get(cid, 0) + 1
+        delay = min(self.interval(cid, n_channels) * 2 ** n, 86400)
+        self.next_due[cid] = time.time() + delay
+        log.warning(f"YT check for {cid} failed ({type(error).__name__}: {error}), retry in {int(delay)}s")
+
+    def record_live(self, cid, ts=None):
+        hour = time.gmtime(ts).tm_hour
+        self.live_hours.setdefault(cid, [0] * 24)[hour] += 1
+
+    def next_wakeup(self, channel_ids):
+        if self.quota.exhausted():
+            return max(self.quota.blocked_until - time.time(), self.min_interval)
+
+        pending = [self.next_due[c] for c in channel_ids if c in self.next_due]
+        if not pending:
+            return self.min_interval
+        # Wake at least every min_interval so newly added channels are noticed
+        return min(max(min(pending) - time.time(), 1), self.min_interval)
+
+    def forget(self, channel_ids):
+        for cid in set(self.next_due) - set(channel_ids):
+            self.next_due.pop(cid, None)
+            self.failures.pop(cid, None)
+
+    def to_dict(self):
+        return {"live_hours": self.live_hours}
+
+    def load(self, d):
+        self.live_hours = {k: list(v) for k, v in (d or {}).get("live_hours", {}).items()}